@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""agenda.py
+
+Udacity conference server-side Python App Engine conference agendas
+
+The agenda of a conference is a denormalized snapshot of its sessions,
+with the name & email of their speakers, ordered by date and start time.
+It is stored compressed in a single Agenda entity, child of the
+conference, and cached in memcache, so reading a schedule is one get. A
+task rebuilds it after every session added to the conference.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Agenda
+from models import Session
+from models import Speaker
+
+from etags import SESSIONS_VERSION_KEY
+from etags import bumpVersion
+
+MEMCACHE_AGENDA_PREFIX = "AGENDA_"
+AGENDA_ID = 1
+
+
+def _agendaKey(c_key):
+    return ndb.Key(Agenda, AGENDA_ID, parent=c_key)
+
+
+def sessionItem(session, speaker):
+    """Return the SessionForm fields of a session, as a dict."""
+    return {
+        'name': session.name,
+        'highlights': session.highlights,
+        'speakerName': speaker.name if speaker else None,
+        'speakerEmail': speaker.email if speaker else session.speakerId,
+        'duration': session.duration,
+        'typeOfSession': session.typeOfSession,
+        'date': str(session.date) if session.date else None,
+        'startTime': str(session.startTime) if session.startTime else None,
+        'websafeConferenceKey': session.key.parent().urlsafe(),
+        'websafeSessionKey': session.key.urlsafe(),
+    }
+
+
+def sortItems(items):
+    """Return agenda items ordered by date, start time & name."""
+    return sorted(items, key=lambda item: (item['date'] or '',
+                                           item['startTime'] or '',
+                                           item['name']))
+
+
+def record(c_key):
+    """Rebuild the agenda of a conference in the background; when called
+    in a transaction it is only rebuilt if the transaction commits."""
+    taskqueue.add(url='/tasks/rebuild_agenda',
+                  params={'websafeConferenceKey': c_key.urlsafe()},
+                  transactional=ndb.in_transaction())
+
+
+def rebuild(c_key):
+    """Rebuild & cache the agenda of a conference, returning its items.
+
+    Sessions & speakers are read outside of a transaction; the agenda is
+    then only written if the conference still has the same sessions, so
+    a rebuild racing with a newer one never overwrites it. The sessions
+    version is only bumped when a stored agenda changed.
+    """
+    while True:
+        sessions = Session.query(ancestor=c_key).fetch()
+        speakers = ndb.get_multi(
+            [ndb.Key(Speaker, session.speakerId) for session in sessions])
+        items = sortItems(sessionItem(session, speaker)
+                          for session, speaker in zip(sessions, speakers))
+        s_keys = set(session.key for session in sessions)
+        result = _putAgenda(c_key, s_keys, items)
+        if result is not None:
+            break
+    stored, changed = result
+    if stored:
+        memcache.set(MEMCACHE_AGENDA_PREFIX + c_key.urlsafe(), items)
+    if changed:
+        # clients may have been given the agenda as it was before
+        bumpVersion(SESSIONS_VERSION_KEY % c_key.urlsafe())
+    return items
+
+
+@ndb.transactional()
+def _putAgenda(c_key, s_keys, items):
+    """Write the agenda if the conference sessions are s_keys, returning
+    None if they are not, else (stored, changed): whether the agenda was
+    stored, and whether it replaced a different one. Agendas without
+    sessions are stored too, so reading them never rebuilds; agendas of
+    deleted or archived conferences are not."""
+    if set(Session.query(ancestor=c_key).fetch(keys_only=True)) != s_keys:
+        return None
+    conf, agenda = ndb.get_multi([c_key, _agendaKey(c_key)])
+    if not conf:
+        return (False, False)
+    if agenda and agenda.sessions == items:
+        return (True, False)
+    Agenda(key=_agendaKey(c_key), sessions=items).put()
+    return (True, agenda is not None)
+
+
+def delete(c_key):
+    """Delete the agenda of a conference; when called in a transaction the
+    cached copy is dropped once it commits."""
+    _agendaKey(c_key).delete()
+    ndb.get_context().call_on_commit(
+        lambda: memcache.delete(MEMCACHE_AGENDA_PREFIX + c_key.urlsafe()))
+
+
+@ndb.tasklet
+def getAgendaAsync(c_key):
+    """Return a future of the agenda items of a conference, from cache if
+    possible. Agendas never built (conferences created before agendas
+    existed) are built on first read."""
+    ctx = ndb.get_context()
+    cacheKey = MEMCACHE_AGENDA_PREFIX + c_key.urlsafe()
+    items = yield ctx.memcache_get(cacheKey)
+    if items is None:
+        agenda = yield _agendaKey(c_key).get_async()
+        if agenda:
+            items = agenda.sessions or []
+            yield ctx.memcache_set(cacheKey, items)
+        else:
+            items = rebuild(c_key)
+    raise ndb.Return(items)
+
+
+def getAgenda(c_key):
+    """Return the agenda items of a conference (see getAgendaAsync)."""
+    return getAgendaAsync(c_key).get_result()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""analytics.py
+
+Udacity conference server-side Python App Engine materialized analytics
+
+Conference counts, capacity, seats available and sessions are aggregated
+by city, start month and topic. Write paths record deltas in a task that
+adds them to one of a few sharded AnalyticsShard entities, so concurrent
+updates seldom contend; reads merge all the shards from a single get. A
+periodic job recomputes everything from scratch to correct any drift.
+
+Each task carries a change id, which picks its shard; the shard keeps
+the ids of the last APPLIED_IDS changes added to it, in the same
+transaction as the counters, so a retried task is not applied twice.
+
+"""
+
+import hashlib
+import json
+import random
+import uuid
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import AnalyticsShard
+from models import Conference
+from models import Session
+
+SHARDS = 10
+# change ids remembered per shard
+APPLIED_IDS = 500
+DIMENSIONS = ('city', 'month', 'topic')
+COUNTERS = ('conferences', 'capacity', 'seatsAvailable', 'sessions')
+# conferences & sessions read per datastore batch when recomputing
+RECOMPUTE_BATCH_SIZE = 500
+
+
+def _shardKeys():
+    return [ndb.Key(AnalyticsShard, i) for i in range(SHARDS)]
+
+
+def conferenceDimensions(conf):
+    """Return the (dimension, value) pairs a conference is aggregated in."""
+    month = conf.startDate.strftime('%Y-%m') if conf.startDate else 'none'
+    return ([('city', conf.city or 'none'), ('month', month)] +
+            [('topic', topic) for topic in conf.topics or []])
+
+
+def conferenceDeltas(conf, sign=1):
+    """Return the deltas adding (or with sign -1, removing) a conference."""
+    return [(dimension, value, counter, sign * amount)
+            for dimension, value in conferenceDimensions(conf)
+            for counter, amount in (('conferences', 1),
+                                    ('capacity', conf.maxAttendees or 0),
+                                    ('seatsAvailable',
+                                     conf.seatsAvailable or 0))]
+
+
+def seatDeltas(conf, seats):
+    """Return the deltas of a change of seats available in a conference."""
+    return [(dimension, value, 'seatsAvailable', seats)
+            for dimension, value in conferenceDimensions(conf)]
+
+
+def sessionDeltas(conf, sessions=1):
+    """Return the deltas of sessions added to a conference."""
+    return [(dimension, value, 'sessions', sessions)
+            for dimension, value in conferenceDimensions(conf)]
+
+
+def _merge(stats, deltas):
+    """Add deltas to a {dimension: {value: {counter: total}}} dict."""
+    for dimension, value, counter, amount in deltas:
+        counters = stats.setdefault(dimension, {}).setdefault(value, {})
+        counters[counter] = counters.get(counter, 0) + amount
+    return stats
+
+
+def record(deltas):
+    """Record deltas in the background; when called in a transaction they
+    are only recorded if it commits."""
+    deltas = [delta for delta in deltas if delta[3]]
+    if deltas:
+        taskqueue.add(url='/tasks/record_analytics',
+                      params={'deltas': json.dumps(deltas),
+                              'changeId': uuid.uuid4().hex},
+                      transactional=ndb.in_transaction())
+
+
+@ndb.transactional()
+def applyDeltas(deltas, changeId=None):
+    """Add deltas to the shard of their change id, unless they were added
+    already; deltas without a change id go to a random shard."""
+    if changeId:
+        shard = int(hashlib.md5(changeId).hexdigest(), 16) % SHARDS
+    else:
+        shard = random.randrange(SHARDS)
+    key = ndb.Key(AnalyticsShard, shard)
+    shard = key.get() or AnalyticsShard(key=key)
+    if changeId in shard.applied:
+        return
+    shard.stats = _merge(dict(shard.stats or {}), deltas)
+    if changeId:
+        shard.applied = (shard.applied + [changeId])[-APPLIED_IDS:]
+    shard.put()
+
+
+def getStats():
+    """Return the aggregates merged from all shards."""
+    stats = {}
+    for shard in ndb.get_multi(_shardKeys()):
+        if shard and shard.stats:
+            for dimension, values in shard.stats.items():
+                for value, counters in values.items():
+                    _merge(stats, [(dimension, value, counter, amount)
+                                   for counter, amount in counters.items()])
+    return stats
+
+
+def recompute():
+    """Recompute the aggregates from every conference & session, and
+    replace the shards with the result."""
+    deltas = []
+    dimensions = {}
+    for conf in Conference.query().iter(batch_size=RECOMPUTE_BATCH_SIZE):
+        deltas.extend(conferenceDeltas(conf))
+        dimensions[conf.key] = conferenceDimensions(conf)
+    for s_key in Session.query().iter(batch_size=RECOMPUTE_BATCH_SIZE,
+                                      keys_only=True):
+        for dimension, value in dimensions.get(s_key.parent(), []):
+            deltas.append((dimension, value, 'sessions', 1))
+    _replaceShards(_merge({}, deltas))
+
+
+@ndb.transactional(xg=True)
+def _replaceShards(stats):
+    # the change ids are kept, so tasks still retried are not applied again
+    shards = [AnalyticsShard(key=key, applied=old.applied if old else [])
+              for key, old in zip(_shardKeys(), ndb.get_multi(_shardKeys()))]
+    shards[0].stats = stats
+    ndb.put_multi(shards)
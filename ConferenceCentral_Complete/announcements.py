@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""announcements.py
+
+Udacity conference server-side Python App Engine announcements
+
+The nearly sold out announcement and the featured speaker message are
+kept in memcache. They are computed here, away from the API surface, so
+the cron, task and warmup handlers can refresh them without importing
+Cloud Endpoints.
+
+"""
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Speaker
+
+from etags import FEATURED_SPEAKER_VERSION_KEY
+from etags import bumpVersion
+
+MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
+                    'are nearly sold out: %s')
+MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
+FEATURED_SPEAKER_MESSAGE = ('Featured speaker: %s!!')
+
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job & warmup.
+    """
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = ANNOUNCEMENT_TPL % (
+            ', '.join(conf.name for conf in confs))
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        announcement = ""
+        memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    return announcement
+
+
+def getAnnouncement():
+    """Return the announcement in memcache, or an empty one."""
+    return memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or ""
+
+
+def setFeaturedSpeaker(message):
+    """Assign the featured speaker message to memcache."""
+    memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, message)
+    bumpVersion(FEATURED_SPEAKER_VERSION_KEY)
+
+
+def cacheFeaturedSpeaker():
+    """Feature the speaker with the most sessions, unless a speaker is
+    already featured in memcache."""
+    if memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) is not None:
+        return
+    speaker = Speaker.query().order(-Speaker.sessionCount).get()
+    if speaker and speaker.sessionCount > 1:
+        if memcache.add(MEMCACHE_FEATURED_SPEAKER_KEY,
+                        FEATURED_SPEAKER_MESSAGE % speaker.name):
+            bumpVersion(FEATURED_SPEAKER_VERSION_KEY)
+
+
+def getFeaturedSpeaker():
+    """Return the featured speaker message in memcache, or an empty one."""
+    return memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) or ""
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""archive.py
+
+Udacity conference server-side Python App Engine conference archive
+
+Conferences that ended more than ARCHIVE_AFTER_DAYS ago (conferences
+without an end date last one day) are moved, with their sessions, to the
+ArchivedConference & ArchivedSession kinds, which only index the few
+fields archive searches filter on. The live kinds, their composite
+indexes and the queries over them then only hold current conferences. A
+daily cron starts a chain of tasks, each archiving one batch of
+conferences read with a keys-only cursor query.
+
+Archived entities keep the parent & id of the originals, so a conference
+is moved within its entity group, a batch of sessions per transaction and
+the conference itself with the last one. Deleting the live entities
+leaves the tombstones read by getChangesSince.
+
+"""
+
+import operator
+from datetime import date
+from datetime import timedelta
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import ArchivedConference
+from models import ArchivedSession
+from models import Conference
+from models import Session
+import agenda
+import analytics
+import facets
+import namecache
+import querycache
+import schedule
+
+ARCHIVE_AFTER_DAYS = 7
+# conferences archived per task & sessions moved per transaction
+BATCH_SIZE = 50
+SESSION_BATCH_SIZE = 100
+# archived conferences read by a search at most
+SEARCH_LIMIT = 1000
+
+CONFERENCE_FIELDS = ('name', 'description', 'organizerUserId', 'topics',
+                     'city', 'startDate', 'month', 'endDate', 'maxAttendees',
+                     'seatsAvailable', 'monthBuckets')
+SESSION_FIELDS = ('name', 'highlights', 'speakerId', 'duration',
+                  'typeOfSession', 'date', 'startTime')
+# fields searched with equality filters in the datastore
+INDEXED_FIELDS = ('city', 'topics', 'month')
+INTEGER_FIELDS = ('month', 'maxAttendees')
+OPERATORS = {'=': operator.eq, '>': operator.gt, '>=': operator.ge,
+             '<': operator.lt, '<=': operator.le, '!=': operator.ne}
+
+
+def archivedKey(c_key):
+    """Return the key of a conference once archived."""
+    return ndb.Key(ArchivedConference, c_key.id(), parent=c_key.parent())
+
+
+def archivedSessionKey(s_key):
+    """Return the key of a session once archived."""
+    return ndb.Key(ArchivedSession, s_key.id(),
+                   parent=archivedKey(s_key.parent()))
+
+
+def liveKey(a_key):
+    """Return the key an archived conference had when it was live."""
+    return ndb.Key(Conference, a_key.id(), parent=a_key.parent())
+
+
+def getSessionItems(a_key):
+    """Return the agenda items (see agenda.py) of the sessions of an
+    archived conference."""
+    sessions = ArchivedSession.query(ancestor=a_key).fetch()
+    speakers = namecache.getSpeakers(
+        [session.speakerId for session in sessions])
+    return agenda.sortItems(
+        agenda.sessionItem(session, speakers.get(session.speakerId))
+        for session in sessions)
+
+
+def _copy(entity, fields):
+    return dict((field, getattr(entity, field)) for field in fields)
+
+
+def start():
+    """Start archiving the conferences that ended before the cutoff."""
+    cutoff = date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    taskqueue.add(url='/tasks/archive_conferences',
+                  params={'cutoff': str(cutoff)})
+
+
+def _endedQuery(phase, cutoff):
+    """Return the query of the conferences that ended before the cutoff:
+    by end date, then (phase 1) the one day conferences without an end
+    date by start date, as schedule.conferenceSpan treats them."""
+    if phase == 0:
+        return Conference.query(Conference.endDate < cutoff)
+    return Conference.query(Conference.endDate == None,
+                            Conference.startDate < cutoff)
+
+
+def archiveBatch(cutoff, cursor=None, phase=0):
+    """Archive one batch of the conferences that ended before the cutoff
+    date, then chain the task archiving the next batch."""
+    c_keys, nextCursor, more = _endedQuery(phase, cutoff).fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor), keys_only=True)
+    for c_key in c_keys:
+        archiveConference(c_key)
+    if c_keys:
+        querycache.invalidate()
+    if more and nextCursor:
+        taskqueue.add(url='/tasks/archive_conferences',
+                      params={'cutoff': str(cutoff), 'phase': phase,
+                              'cursor': nextCursor.urlsafe()})
+    elif phase == 0:
+        taskqueue.add(url='/tasks/archive_conferences',
+                      params={'cutoff': str(cutoff), 'phase': 1})
+
+
+def archiveConference(c_key):
+    """Move a conference & its sessions to the archive. Safe to retry."""
+    while not _moveBatch(c_key):
+        pass
+
+
+@ndb.transactional()
+def _moveBatch(c_key):
+    """Move a batch of sessions of a conference to the archive, and the
+    conference itself after the last one. Return True once it is moved."""
+    conf = c_key.get()
+    if not conf:
+        return True
+    sessions = Session.query(ancestor=c_key).fetch(SESSION_BATCH_SIZE)
+    if sessions:
+        ndb.put_multi([
+            ArchivedSession(key=archivedSessionKey(session.key),
+                            **_copy(session, SESSION_FIELDS))
+            for session in sessions])
+        ndb.delete_multi([session.key for session in sessions])
+        analytics.record(analytics.sessionDeltas(conf, -len(sessions)))
+        return False
+
+    # live analytics & facet counts only cover live conferences
+    ArchivedConference(key=archivedKey(c_key), **_copy(conf, CONFERENCE_FIELDS)).put()
+    c_key.delete()
+    agenda.delete(c_key)
+    analytics.record(analytics.conferenceDeltas(conf, -1))
+    facets.record(facets.conferenceDeltas(conf, -1))
+    return True
+
+
+def _matches(conf, field, op, value):
+    values = getattr(conf, field)
+    if not isinstance(values, list):
+        values = [values]
+    return any(op(v, value) for v in values)
+
+
+def search(filters, dateRange=None):
+    """Return the archived conferences matching filters formatted by
+    _formatFilters, ordered by name.
+
+    Equality filters on indexed fields & the month buckets of a date range
+    are run in the datastore, which merges the single property indexes,
+    so no composite index is needed; the other filters and the exact date
+    range are applied to the results.
+    """
+    query = ArchivedConference.query()
+    remaining = []
+    for filtr in filters:
+        field, op, value = filtr['field'], filtr['operator'], filtr['value']
+        if field == 'dates':
+            continue
+        if field in INTEGER_FIELDS:
+            value = int(value)
+        if op == '=' and field in INDEXED_FIELDS:
+            query = query.filter(ndb.query.FilterNode(field, op, value))
+        else:
+            remaining.append((field, OPERATORS[op], value))
+    if dateRange:
+        query = query.filter(ArchivedConference.monthBuckets.IN(
+            schedule.monthBuckets(*dateRange)))
+
+    conferences = [
+        conf for conf in query.fetch(SEARCH_LIMIT)
+        if all(_matches(conf, field, op, value)
+               for field, op, value in remaining) and
+        (not dateRange or schedule.spanOverlaps(conf, *dateRange))]
+    return sorted(conferences, key=lambda conf: conf.name)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""build.py -- Udacity conference static asset build
+
+Bundles & minifies the local CSS and JS loaded by templates/index.html,
+inlines the Angular partials into the template cache and fingerprints the
+bundles, then writes a deployable copy of the app to dist/ whose app.yaml
+serves the fingerprinted bundles with far-future expiration.
+
+usage: python build.py [dist dir]
+deploy: appcfg.py update dist
+
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DIST = 'dist'
+
+# URL prefixes of the local assets, mapped to their directories (app.yaml)
+ASSET_DIRS = {
+    '/css/': os.path.join('static', 'bootstrap', 'css'),
+    '/js/': os.path.join('static', 'js'),
+}
+PARTIALS_DIR = os.path.join('static', 'partials')
+PARTIALS_URL = '/partials/'
+# fingerprinted bundles are written here and served from BUILD_URL
+BUILD_DIR = os.path.join('static', 'build')
+BUILD_URL = '/build/'
+BUNDLE_EXPIRATION = '365d'
+# expiration of the assets that are not fingerprinted
+ASSET_EXPIRATION = '7d'
+
+# development scripts, not deployed
+SCRIPTS = ['build.py', 'startup_time.py']
+# files & directories copied as is to the dist dir
+COPY = ['app.yaml', 'cron.yaml', 'index.yaml', 'queue.yaml',
+        os.path.join('static', 'img'), os.path.join('static', 'fonts'),
+        os.path.join('static', 'partials'), os.path.join('static', 'js'),
+        os.path.join('static', 'bootstrap')]
+
+# bootstrap-cosmo.css is a complete Bootstrap theme, the CDN Bootstrap
+# stylesheet loaded before it is redundant
+REDUNDANT_CSS = re.compile(
+    r'[ \t]*<link rel="stylesheet" href="//netdna\.bootstrapcdn\.com/'
+    r'bootstrap/[^"]+/css/bootstrap(\.min)?\.css">\n')
+LOCAL_CSS = re.compile(r'[ \t]*<link rel="stylesheet" href="(/css/[^"]+)">\n')
+LOCAL_JS = re.compile(r'[ \t]*<script src="(/js/[^"]+)"></script>\n')
+
+
+def read(path):
+    with io.open(os.path.join(ROOT, path), encoding='utf-8') as f:
+        return f.read()
+
+
+def write(path, content):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+
+def minifyCss(source):
+    """Strip comments & whitespace from a stylesheet."""
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r' ?([{};,>]) ?', r'\1', source)
+    return source.replace(';}', '}').strip() + '\n'
+
+
+def minifyJs(source):
+    """Strip comments, indentation & blank lines from a script.
+
+    Line breaks are kept so automatic semicolon insertion is unaffected;
+    string & regular expression literals are copied untouched.
+    """
+    out = []
+    last = ''  # last significant character written
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c in '\'"':
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            last, i = c, j + 1
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            j = n if j < 0 else j + 2
+            out.append('\n' if '\n' in source[i:j] else ' ')
+            i = j
+        elif c == '/' and (not last or last in '(,=:[!&|?{};+-*%<>~^'):
+            # regular expression literal
+            j, inClass = i + 1, False
+            while j < n and (source[j] != '/' or inClass):
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '[':
+                    inClass = True
+                elif source[j] == ']':
+                    inClass = False
+                j += 1
+            out.append(source[i:j + 1])
+            last, i = '/', j + 1
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            out.append('\n' if '\n' in source[i:j] else ' ')
+            i = j
+        else:
+            out.append(c)
+            last, i = c, i + 1
+    lines = [line.strip() for line in ''.join(out).split('\n')]
+    return '\n'.join(line for line in lines if line) + '\n'
+
+
+def templateCacheJs():
+    """Return a script putting every partial in the Angular template cache,
+    under the URL the routes request it with."""
+    puts = []
+    for name in sorted(os.listdir(os.path.join(ROOT, PARTIALS_DIR))):
+        if name.endswith('.html'):
+            puts.append('$templateCache.put(%s, %s);' % (
+                json.dumps(PARTIALS_URL + name),
+                json.dumps(read(os.path.join(PARTIALS_DIR, name)))))
+    return ("angular.module('conferenceApp').run(['$templateCache', "
+            "function ($templateCache) {\n%s\n}]);\n" % '\n'.join(puts))
+
+
+def assetPath(url):
+    """Return the path of the local asset served at url."""
+    for prefix, directory in ASSET_DIRS.items():
+        if url.startswith(prefix):
+            return os.path.join(directory, url[len(prefix):])
+    raise ValueError('Unknown asset URL: %s' % url)
+
+
+def fingerprint(dist, name, ext, content):
+    """Write a bundle named after its content hash, return its URL."""
+    digest = hashlib.md5(content.encode('utf-8')).hexdigest()[:10]
+    filename = '%s.%s.%s' % (name, digest, ext)
+    write(os.path.join(dist, BUILD_DIR, filename), content)
+    return BUILD_URL + filename
+
+
+def buildIndex(dist):
+    """Write the bundles & the index.html loading them."""
+    html = REDUNDANT_CSS.sub('', read(os.path.join('templates',
+                                                   'index.html')))
+
+    # one stylesheet, in place of the first local one
+    cssUrls = LOCAL_CSS.findall(html)
+    css = ''.join(minifyCss(read(assetPath(url))) for url in cssUrls)
+    cssUrl = fingerprint(dist, 'app', 'css', css)
+    html = LOCAL_CSS.sub(
+        lambda m: (m.group(0).replace(m.group(1), cssUrl)
+                   if m.group(1) == cssUrls[0] else ''), html)
+
+    # one script with the partials inlined, in place of the first local one
+    jsUrls = LOCAL_JS.findall(html)
+    js = ''.join(minifyJs(read(assetPath(url))) for url in jsUrls)
+    js += minifyJs(templateCacheJs())
+    jsUrl = fingerprint(dist, 'app', 'js', js)
+    html = LOCAL_JS.sub(
+        lambda m: (m.group(0).replace(m.group(1), jsUrl)
+                   if m.group(1) == jsUrls[0] else ''), html)
+
+    write(os.path.join(dist, 'templates', 'index.html'), html)
+    return cssUrl, jsUrl
+
+
+def buildAppYaml(dist):
+    """Write app.yaml serving the bundles with far-future expiration."""
+    yaml = read('app.yaml')
+    # not fingerprinted, but rarely changing
+    for url in ('/img', '/fonts'):
+        yaml = yaml.replace(
+            '- url: %s\n  static_dir: static%s\n' % (url, url),
+            '- url: %s\n  static_dir: static%s\n  expiration: "%s"\n' % (
+                url, url, ASSET_EXPIRATION))
+    yaml = yaml.replace(
+        'handlers:       # static then dynamic\n',
+        'handlers:       # static then dynamic\n\n'
+        '- url: %s\n  static_dir: %s\n  expiration: "%s"\n' % (
+            BUILD_URL.rstrip('/'), BUILD_DIR.replace(os.sep, '/'),
+            BUNDLE_EXPIRATION), 1)
+    write(os.path.join(dist, 'app.yaml'), yaml)
+
+
+def build(dist=DIST):
+    dist = os.path.join(ROOT, dist)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+    # python sources & configuration
+    for name in os.listdir(ROOT):
+        if name.endswith('.py') and name not in SCRIPTS:
+            shutil.copy(os.path.join(ROOT, name), dist)
+    for path in COPY:
+        source = os.path.join(ROOT, path)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(dist, path))
+        elif os.path.isfile(source):
+            shutil.copy(source, os.path.join(dist, path))
+    cssUrl, jsUrl = buildIndex(dist)
+    buildAppYaml(dist)
+    return cssUrl, jsUrl
+
+
+if __name__ == '__main__':
+    for url in build(*sys.argv[1:]):
+        print('built %s' % url)
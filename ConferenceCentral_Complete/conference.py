@@ -13,6 +13,9 @@ created by wesc on 2014 apr 21
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 from datetime import datetime
+from datetime import timedelta
+import json
+import uuid
 
 import endpoints
 from protorpc import messages
@@ -21,42 +24,85 @@ from protorpc import remote
 
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 
-from models import ConflictException
 from models import Profile
-from models import ProfileMiniForm
-from models import ProfileForm
-from models import StringMessage
-from models import BooleanMessage
+from models import ArchivedConference
 from models import Conference
-from models import ConferenceForm
-from models import ConferenceForms
-from models import ConferenceQueryForm
-from models import ConferenceQueryForms
-from models import TeeShirtSize
 from models import Session
-from models import SessionMiniForm
-from models import SessionForm
-from models import SessionForms
 from models import Speaker
-from models import SpeakerForm
+from forms import ConflictException
+from forms import ProfileMiniForm
+from forms import ProfileForm
+from forms import StringMessage
+from forms import BooleanMessage
+from forms import ConferenceForm
+from forms import ConferenceForms
+from forms import ConferenceQueryForm
+from forms import ConferenceQueryForms
+from forms import TeeShirtSize
+from forms import SessionMiniForm
+from forms import SessionForm
+from forms import SessionForms
+from forms import SpeakerForm
+from forms import SpeakerForms
+from forms import SessionConflictForm
+from forms import SessionConflictForms
+from forms import WishlistMessage
+from forms import AnalyticsForm
+from forms import AnalyticsForms
+from forms import FacetForm
+from forms import WaitlistForm
+from forms import ConferenceDetailForm
+from forms import FacetForms
+from forms import ChangesForm
+
+from schedule import durationLimitFor
+from schedule import MAX_SPAN_BUCKETS
+from schedule import sessionInterval
+from schedule import spanBucketCover
+from schedule import spanFits
+from schedule import spanOverlaps
+from schedule import startBlockCover
+from schedule import SessionIntervalIndex
 
 from settings import WEB_CLIENT_ID
 from settings import ANDROID_CLIENT_ID
 from settings import IOS_CLIENT_ID
 from settings import ANDROID_AUDIENCE
+from settings import ADMIN_EMAILS
 
 from utils import getUserId
 
+import agenda
+import archive
+import analytics
+import announcements
+import facets
+import feeds
+import namecache
+import notifications
+import profiling
+import querycache
+import ratelimit
+import waitlist
+import recommendations
+import speakers
+import sync
+
+from etags import CONFERENCE_VERSION_KEY
+from etags import FEATURED_SPEAKER_VERSION_KEY
+from etags import SESSIONS_VERSION_KEY
+from etags import PROFILE_VERSION_KEY
+from etags import bumpVersionOnCommit
+from etags import contentEtag
+from etags import etag
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
-                    'are nearly sold out: %s')
-MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
-FEATURED_SPEAKER_MESSAGE = ('Featured speaker: %s!!')
+MEMCACHE_SESSION_INTERVALS_PREFIX = "SESSION_INTERVALS_"
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
@@ -71,6 +117,22 @@ SESSION_DEFAULTS = {
     "startTime": "00:00",
 }
 
+# sessions returned by getConferenceDetail
+DETAIL_SESSIONS = 20
+
+# conferences returned by getRecommendedConferences
+RECOMMENDATIONS = 10
+
+SPEAKERS_PAGE_SIZE = 20
+SPEAKERS_MAX_PAGE_SIZE = 100
+
+# start time ranges (both ends included) of the periods of the day
+PERIODS = {
+    'morning': (None, "12:00"),
+    'afternoon': ("12:01", "18:00"),
+    'evening': ("18:01", None),
+}
+
 OPERATORS = {
     'EQ': '=',
     'GT': '>',
@@ -80,11 +142,22 @@ OPERATORS = {
     'NE': '!='
 }
 
+# changes to these Conference fields are notified to the attendees
+ATTENDEE_NOTIFIED_FIELDS = ('city', 'startDate', 'endDate')
+
 FIELDS = {
     'CITY': 'city',
     'TOPIC': 'topics',
     'MONTH': 'month',
     'MAX_ATTENDEES': 'maxAttendees',
+    'DATE': 'dates',
+}
+
+# filter fields with facet counts, mapped to their facets.py names
+FACET_FIELDS = {
+    'CITY': 'city',
+    'TOPIC': 'topic',
+    'MONTH': 'month',
 }
 
 CONF_GET_REQUEST = endpoints.ResourceContainer(
@@ -92,6 +165,17 @@ CONF_GET_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+CONF_GET_CONDITIONAL_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+CONDITIONAL_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
 CONF_POST_REQUEST = endpoints.ResourceContainer(
     ConferenceForm,
     websafeConferenceKey=messages.StringField(1),
@@ -102,14 +186,39 @@ SESSION_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+CHANGES_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    token=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+)
+
+SPEAKERS_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    namePrefix=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+)
+
+SPEAKER_SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
+    SpeakerForm,
+    websafeConferenceKey=messages.StringField(5),
+)
+
 SESSION_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     sessionKey=messages.StringField(1),
 )
 
+SESSION_WISHLIST_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    sessionKey=messages.StringField(1),
+    reportConflicts=messages.BooleanField(2),
+)
+
 SESSIONS_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
 )
 
 SESSIONS_GET_REQUEST_WITH_TYPE = endpoints.ResourceContainer(
@@ -129,6 +238,14 @@ SESSIONS_GET_REQUEST_PERIOD = endpoints.ResourceContainer(
     period=messages.StringField(2),
 )
 
+SESSIONS_GET_REQUEST_RANGE = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    startFrom=messages.StringField(2),
+    startTo=messages.StringField(3),
+    maxDuration=messages.IntegerField(4),
+)
+
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -176,6 +293,8 @@ class ConferenceApi(remote.Service):
                 request.all_fields()}
         del data['websafeKey']
         del data['organizerDisplayName']
+        del data['etag']
+        del data['notModified']
 
         # add default values for those missing (both data model & outbound Message)
         for df in DEFAULTS:
@@ -193,6 +312,7 @@ class ConferenceApi(remote.Service):
         if data['endDate']:
             data['endDate'] = datetime.strptime(data['endDate'][:10],
                                                 "%Y-%m-%d").date()
+        self._checkConferenceSpan(data['startDate'], data['endDate'])
 
         # set seatsAvailable to be same as maxAttendees on creation
         if data["maxAttendees"] > 0:
@@ -205,15 +325,27 @@ class ConferenceApi(remote.Service):
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
-        # create Conference, send email to organizer confirming
+        # create Conference, notify organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email'
-                      )
+        conf = Conference(**data)
+        conf.put()
+        analytics.record(analytics.conferenceDeltas(conf))
+        facets.record(facets.conferenceDeltas(conf))
+        recommendations.record(conf)
+        querycache.invalidate()
+        notifications.enqueue(user.email(), 'conferenceCreated',
+                              name=request.name, city=request.city,
+                              startDate=request.startDate or '',
+                              endDate=request.endDate or '')
         return request
 
+    def _checkConferenceSpan(self, startDate, endDate):
+        """Reject conferences lasting longer than their date buckets can
+        cover (schedule.py)."""
+        if startDate and endDate and not spanFits(startDate, endDate):
+            raise endpoints.BadRequestException(
+                "Conferences can last at most %d weeks." % MAX_SPAN_BUCKETS)
+
     @ndb.transactional()
     def _updateConferenceObject(self, request):
         user = endpoints.get_current_user()
@@ -237,6 +369,16 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        # remember the fields attendees are notified about, and remove the
+        # conference as it was from the analytics
+        notified = dict((field, getattr(conf, field))
+                        for field in ATTENDEE_NOTIFIED_FIELDS)
+        deltas = analytics.conferenceDeltas(conf, -1)
+        facetDeltas = facets.conferenceDeltas(conf, -1)
+        oldTopics = list(conf.topics)
+        queried = dict((field, getattr(conf, field))
+                       for field in querycache.FIELDS)
+
         # Not getting all the fields, so don't create a new object; just
         # copy relevant fields from ConferenceForm to Conference object
         for field in request.all_fields():
@@ -250,7 +392,26 @@ class ConferenceApi(remote.Service):
                         conf.month = data.month
                 # write to Conference object
                 setattr(conf, field.name, data)
+        self._checkConferenceSpan(conf.startDate, conf.endDate)
         conf.put()
+        bumpVersionOnCommit(CONFERENCE_VERSION_KEY % conf.key.urlsafe())
+        analytics.record(deltas + analytics.conferenceDeltas(conf))
+        facets.record(facetDeltas + facets.conferenceDeltas(conf))
+        recommendations.record(conf, oldTopics)
+        querycache.invalidate([field for field, old in queried.items()
+                               if getattr(conf, field) != old])
+
+        # fan out the changes to the attendees in background tasks
+        changes = ['%s: %s -> %s' % (field, old, getattr(conf, field))
+                   for field, old in sorted(notified.items())
+                   if getattr(conf, field) != old]
+        if changes:
+            taskqueue.add(url='/tasks/notify_attendees',
+                          params={'websafeConferenceKey': request.websafeConferenceKey,
+                                  'changeId': uuid.uuid4().hex,
+                                  'data': json.dumps({'name': conf.name,
+                                                      'changes': '\r\n'.join(changes)})},
+                          transactional=True)
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
@@ -267,19 +428,112 @@ class ConferenceApi(remote.Service):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_GET_CONDITIONAL_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        # the form depends on the conference & the organizer display name;
+        # check the ETag before loading anything
+        c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        tag = etag(CONFERENCE_VERSION_KEY % request.websafeConferenceKey,
+                   PROFILE_VERSION_KEY % c_key.parent().id())
+        if tag and tag == request.ifNoneMatch:
+            return ConferenceForm(etag=tag, notModified=True)
+
+        # get Conference object from request, or its archived copy if it
+        # was archived since (archive.py); bail if not found
+        conf = c_key.get()
+        if not conf and c_key.kind() == Conference.__name__:
+            conf = archive.archivedKey(c_key).get()
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
         # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        cf = self._copyConferenceToForm(
+            conf, namecache.getOrganizerName(c_key.parent().id()))
+        cf.etag = tag
+        return cf
+
+    @endpoints.method(CONF_GET_CONDITIONAL_REQUEST, ConferenceDetailForm,
+                      path='conference/{websafeConferenceKey}/detail',
+                      http_method='GET', name='getConferenceDetail')
+    def getConferenceDetail(self, request):
+        """Return a conference with the registration and wishlist state of
+        the caller, the featured speaker and the first sessions."""
+        wsck = request.websafeConferenceKey
+        try:
+            c_key = ndb.Key(urlsafe=wsck)
+        except Exception:
+            c_key = None
+        if not c_key or c_key.kind() not in (Conference.__name__,
+                                             ArchivedConference.__name__):
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        live = c_key.kind() == Conference.__name__
+        user = endpoints.get_current_user()
+        if user:
+            user_id = getUserId(user)
+
+        # the detail depends on the conference, its organizer & sessions,
+        # the featured speaker and the caller; check the ETag before
+        # loading anything
+        versionKeys = [CONFERENCE_VERSION_KEY % wsck,
+                       PROFILE_VERSION_KEY % c_key.parent().id(),
+                       SESSIONS_VERSION_KEY % wsck,
+                       FEATURED_SPEAKER_VERSION_KEY]
+        if user:
+            versionKeys.append(PROFILE_VERSION_KEY % user_id)
+        tag = etag(*versionKeys)
+        if tag and tag == request.ifNoneMatch:
+            return ConferenceDetailForm(etag=tag, notModified=True)
+
+        # issue every read at once, then wait for them
+        conf_future = c_key.get_async()
+        organiser_future = c_key.parent().get_async()
+        agenda_future = agenda.getAgendaAsync(c_key) if live else None
+        featured_future = ndb.get_context().memcache_get(
+            announcements.MEMCACHE_FEATURED_SPEAKER_KEY)
+        if user:
+            prof_future = ndb.Key(Profile, user_id).get_async()
+            waitlist_future = waitlist.positionAsync(wsck, user_id)
+
+        conf = conf_future.get_result()
+        if not conf and live:
+            # the conference was archived since (archive.py)
+            c_key, live = archive.archivedKey(c_key), False
+            conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        organiser = organiser_future.get_result()
+        if live:
+            items = agenda_future.get_result()
+        else:
+            items = archive.getSessionItems(c_key)
+        # registrations & wishlists hold the keys of live entities
+        l_key = c_key if live else archive.liveKey(c_key)
+        detail = ConferenceDetailForm(
+            conference=self._copyConferenceToForm(
+                conf, getattr(organiser, 'displayName', None)),
+            featuredSpeaker=featured_future.get_result() or "",
+            sessions=[SessionForm(**item)
+                      for item in items[:DETAIL_SESSIONS]],
+            sessionCount=len(items),
+            etag=tag)
+        if user:
+            prof = prof_future.get_result()
+            detail.isAttending = bool(
+                prof and l_key.urlsafe() in prof.conferenceKeysToAttend)
+            s_keys = [ndb.Key(urlsafe=wssk)
+                      for wssk in (prof.sessionsWishlist if prof else [])]
+            # archived sessions are listed under their archived keys
+            detail.wishlistSessionKeys = [
+                (s_key if live else archive.archivedSessionKey(s_key)
+                 ).urlsafe()
+                for s_key in s_keys if s_key.parent() == l_key]
+            detail.waitlistPosition = waitlist_future.get_result()
+        return detail
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='getConferencesCreated',
@@ -307,14 +561,26 @@ class ConferenceApi(remote.Service):
         q = Conference.query()
         inequality_filter, filters = self._formatFilters(request.filters)
 
-        # If exists, sort on inequality filter first
+        # date ranges are equality filters on the precomputed buckets of the
+        # conferences (see schedule.py); queryConferences trims the edges
+        dateRange = self._dateRange(filters)
+        if dateRange:
+            prop, buckets = spanBucketCover(*dateRange)
+            q = q.filter(ndb.GenericProperty(prop).IN(buckets))
+
+        # If exists, sort on inequality filter first; date ranges with
+        # equality filters only are unordered merge joins over the built-in
+        # indexes, sorted by _queryLiveConferences
         if not inequality_filter:
-            q = q.order(Conference.name)
+            if not dateRange:
+                q = q.order(Conference.name)
         else:
             q = q.order(ndb.GenericProperty(inequality_filter))
             q = q.order(Conference.name)
 
         for filtr in filters:
+            if filtr["field"] == "dates":
+                continue
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(filtr["field"],
@@ -339,6 +605,19 @@ class ConferenceApi(remote.Service):
                 raise endpoints.BadRequestException(
                     "Filter contains invalid field or operator.")
 
+            # date filters bound a date range, they are not inequalities
+            if filtr["field"] == "dates":
+                if filtr["operator"] == "!=":
+                    raise endpoints.BadRequestException(
+                        "Date filters can not use the != operator.")
+                try:
+                    datetime.strptime(filtr["value"], "%Y-%m-%d")
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Date filter value must be a YYYY-MM-DD date.")
+                formatted_filters.append(filtr)
+                continue
+
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
                 # check if inequality operation has been used in previous filters
@@ -353,33 +632,200 @@ class ConferenceApi(remote.Service):
             formatted_filters.append(filtr)
         return (inequality_field, formatted_filters)
 
+    def _dateRange(self, filters):
+        """Return the (first, last) days bounded by the date filters
+        formatted by _formatFilters, or None if there are none."""
+        first = last = None
+        for filtr in filters:
+            if filtr["field"] != "dates":
+                continue
+            day = datetime.strptime(filtr["value"], "%Y-%m-%d").date()
+            operator = filtr["operator"]
+            if operator == ">":
+                day += timedelta(days=1)
+            elif operator == "<":
+                day -= timedelta(days=1)
+            if operator in ("=", ">", ">=") and (first is None or day > first):
+                first = day
+            if operator in ("=", "<", "<=") and (last is None or day < last):
+                last = day
+        if first is None and last is None:
+            return None
+        if first is None or last is None:
+            raise endpoints.BadRequestException(
+                "Date ranges need both a lower and an upper bound.")
+        if spanBucketCover(first, last) is None:
+            raise endpoints.BadRequestException(
+                "Date ranges can span at most %d months." % MAX_SPAN_BUCKETS)
+        return (first, last)
+
+    def _checkDateFilters(self, filters):
+        """Reject the date range queries with other filters that have no
+        composite index (index.yaml): a date range combines with any
+        equality filters, or with max attendees filters only."""
+        others = [filtr for filtr in filters if filtr["field"] != "dates"]
+        if len(others) == len(filters):
+            return
+        equalities = all(filtr["operator"] == "=" for filtr in others)
+        capacity = all(filtr["field"] == "maxAttendees" for filtr in others)
+        if not equalities and not capacity:
+            raise endpoints.BadRequestException(
+                "Date filters combine with equality filters, or with max "
+                "attendees filters only.")
+
+    def _queryLiveConferences(self, request, formatted):
+        """Return the live conferences matching the filters formatted by
+        _formatFilters, reading the keys through the query cache."""
+        self._checkDateFilters(formatted)
+        filters = querycache.canonical(formatted)
+        wscks, cacheKey = querycache.get(filters)
+        if wscks is not None:
+            c_keys = [ndb.Key(urlsafe=wsck) for wsck in wscks]
+            return [conf for conf in ndb.get_multi(c_keys) if conf]
+
+        c_keys = self._getQuery(request).fetch(keys_only=True)
+        conferences = [conf for conf in ndb.get_multi(c_keys) if conf]
+        if (self._dateRange(formatted) and
+                all(filtr["operator"] == "=" for filtr in formatted
+                    if filtr["field"] != "dates")):
+            # unordered date range query (_getQuery)
+            conferences.sort(key=lambda conf: conf.name)
+        querycache.put(cacheKey, [conf.key.urlsafe() for conf in conferences])
+        return conferences
+
     @endpoints.method(ConferenceQueryForms, ConferenceForms,
                       path='queryConferences',
                       http_method='POST',
                       name='queryConferences')
+    @ratelimit.limited
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
-
-        # need to fetch organiser displayName from profiles
-        # get all keys and use get_multi for speed
-        organisers = [(ndb.Key(Profile, conf.organizerUserId)) for conf in
-                      conferences]
-        profiles = ndb.get_multi(organisers)
+        """Query for conferences, or archived conferences if requested."""
+        formatted = self._formatFilters(request.filters)[1]
+        dateRange = self._dateRange(formatted)
+        if dateRange and dateRange[1] < dateRange[0]:
+            return ConferenceForms(items=[])
+        if request.archived:
+            # the archive is searched without cache nor composite indexes
+            conferences = archive.search(formatted, dateRange)
+        else:
+            # the keys of the matching conferences are cached by filters
+            conferences = self._queryLiveConferences(request, formatted)
+        if dateRange:
+            # buckets are coarser than the requested days, trim the edges
+            conferences = [conf for conf in conferences
+                           if spanOverlaps(conf, *dateRange)]
 
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        # organiser display names are cached in the instance (namecache.py)
+        names = namecache.getOrganizerNames(
+            [conf.organizerUserId for conf in conferences])
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
             items=[
-                self._copyConferenceToForm(conf, names[conf.organizerUserId])
+                self._copyConferenceToForm(conf,
+                                           names.get(conf.organizerUserId))
                 for conf in \
                 conferences]
         )
 
+    def _facetFilters(self, filters):
+        """Return the {field: value} equality filters on city, topic and
+        month; other filters do not narrow the facet counts."""
+        self._formatFilters(filters)
+        narrowed = {}
+        for f in filters:
+            if f.operator != 'EQ' or f.field not in FACET_FIELDS:
+                continue
+            field, value = FACET_FIELDS[f.field], f.value
+            if field == 'month':
+                try:
+                    value = str(int(value))
+                except ValueError:
+                    raise endpoints.BadRequestException(
+                        "Month filter value must be a number.")
+            if narrowed.get(field, value) != value:
+                raise endpoints.BadRequestException(
+                    "Facets can be narrowed by one value per field.")
+            narrowed[field] = value
+        return narrowed
+
+    @endpoints.method(ConferenceQueryForms, FacetForms,
+                      path='conferences/facets',
+                      http_method='POST',
+                      name='getConferenceFacets')
+    def getConferenceFacets(self, request):
+        """Return the number of conferences per city, topic and month,
+        narrowed by the equality filters on those fields."""
+        counts = facets.getFacets(self._facetFilters(request.filters))
+        names = dict((field, name) for name, field in FACET_FIELDS.items())
+        items = []
+        for field in facets.FIELDS:
+            values = counts.get(field, {})
+            items.extend(
+                FacetForm(field=names[field], value=value, count=count)
+                for value, count in sorted(values.items(),
+                                           key=lambda item: (-item[1],
+                                                             item[0]))
+                if count > 0)
+        return FacetForms(items=items)
+
+    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+                      path='conferences/recommended',
+                      http_method='GET', name='getRecommendedConferences')
+    def getRecommendedConferences(self, request):
+        """Return upcoming conferences sharing topics and cities with the
+        conferences the user attends."""
+        prof = self._getProfileFromUser()
+        attended = ndb.get_multi([ndb.Key(urlsafe=wsck) for wsck in
+                                  prof.conferenceKeysToAttend])
+        wscks = recommendations.recommend(
+            [conf for conf in attended if conf], RECOMMENDATIONS)
+
+        # organizer profiles are the parents of the conference keys, so
+        # conferences & organizers are read with a single get
+        c_keys = [ndb.Key(urlsafe=wsck) for wsck in wscks]
+        entities = ndb.get_multi(c_keys + [c_key.parent() for c_key in c_keys])
+        confs, organisers = entities[:len(c_keys)], entities[len(c_keys):]
+        return ConferenceForms(items=[
+            self._copyConferenceToForm(conf, getattr(organiser, 'displayName',
+                                                     None))
+            for conf, organiser in zip(confs, organisers) if conf])
+
+    @endpoints.method(CHANGES_GET_REQUEST, ChangesForm,
+                      path='changes',
+                      http_method='GET', name='getChangesSince')
+    def getChangesSince(self, request):
+        """Return the conferences & sessions changed and the keys of those
+        deleted since a sync token (see sync.py); everything without one.
+        Pages are chained with nextToken while more is set."""
+        pageSize = min(request.pageSize or sync.PAGE_SIZE, sync.MAX_PAGE_SIZE)
+        try:
+            changes = sync.changesSince(request.token, pageSize)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid sync token')
+
+        # names are read in batches through the name cache
+        names = namecache.getOrganizerNames(
+            [conf.organizerUserId for conf in changes.conferences])
+        speakerNames = namecache.getSpeakers(
+            [session.speakerId for session in changes.sessions])
+        sessions = []
+        for session in changes.sessions:
+            sf = self._copySessionToForm(session,
+                                         speakerNames.get(session.speakerId))
+            sf.websafeConferenceKey = session.key.parent().urlsafe()
+            sessions.append(sf)
+        return ChangesForm(
+            conferences=[
+                self._copyConferenceToForm(conf,
+                                           names.get(conf.organizerUserId))
+                for conf in changes.conferences],
+            sessions=sessions,
+            deletedKeys=changes.deletedKeys,
+            nextToken=changes.nextToken,
+            more=changes.more,
+            fullSync=changes.fullSync)
+
     # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
@@ -437,15 +883,26 @@ class ConferenceApi(remote.Service):
                         # else:
                         #    setattr(prof, field, val)
                         prof.put()
+                        bumpVersionOnCommit(PROFILE_VERSION_KEY % prof.key.id())
+                        namecache.invalidateOrganizer(prof.key.id())
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
 
-    @endpoints.method(message_types.VoidMessage, ProfileForm,
+    @endpoints.method(CONDITIONAL_GET_REQUEST, ProfileForm,
                       path='profile', http_method='GET', name='getProfile')
     def getProfile(self, request):
         """Return user profile."""
-        return self._doProfile()
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        # check the ETag before loading the profile
+        tag = etag(PROFILE_VERSION_KEY % getUserId(user))
+        if tag and tag == request.ifNoneMatch:
+            return ProfileForm(etag=tag, notModified=True)
+        pf = self._doProfile()
+        pf.etag = tag
+        return pf
 
     @endpoints.method(ProfileMiniForm, ProfileForm,
                       path='profile', http_method='POST', name='saveProfile')
@@ -455,8 +912,9 @@ class ConferenceApi(remote.Service):
 
     # - - - Session objects - - - - - - - - - - - - - - - - - - -
 
-    def _copySessionToForm(self, session):
-        """Receives a Session entiry and generates a SessionForm."""
+    def _copySessionToForm(self, session, speaker=None):
+        """Receives a Session entiry and generates a SessionForm. The speaker
+        is retrieved from the name cache (namecache.py) if not provided."""
         sf = SessionForm()
         for field in sf.all_fields():
             if hasattr(session, field.name):
@@ -466,8 +924,8 @@ class ConferenceApi(remote.Service):
                 else:
                     setattr(sf, field.name, getattr(session, field.name))
         # retrieve speaker information from speakerId
-        speaker_key = ndb.Key(Speaker, session.speakerId)
-        speaker = speaker_key.get()
+        if not speaker:
+            speaker = namecache.getSpeaker(session.speakerId)
         setattr(sf, 'speakerName', getattr(speaker, 'name'))
         setattr(sf, 'speakerEmail', getattr(speaker, 'email'))
         setattr(sf, 'websafeSessionKey', session.key.urlsafe())
@@ -530,6 +988,7 @@ class ConferenceApi(remote.Service):
             speaker.email = request.speakerEmail
             speaker.key = speaker_key
             speaker.put()
+            namecache.invalidateSpeaker(speaker_key.id())
 
         # copy request values to to a new dictionary, and remove
         # unnecessary ones
@@ -564,8 +1023,41 @@ class ConferenceApi(remote.Service):
         # create the session entity and store it in the Datastore
         session = Session(**data)
         session.put()
+        analytics.record(analytics.sessionDeltas(conf))
+        bumpVersionOnCommit(SESSIONS_VERSION_KEY % websafeConferenceKey)
+        agenda.record(c_key)
+        speakers.addSessionToSpeaker(speaker_key, session_key)
         return session
 
+    def _querySessionsByTime(self, c_key=None, startFrom=None, startTo=None,
+                             maxDuration=None):
+        """Return sessions starting between startFrom and startTo and lasting
+        at most maxDuration minutes, optionally within one conference."""
+        if c_key:
+            sessions = Session.query(ancestor=c_key)
+        else:
+            sessions = Session.query()
+
+        # use equality filters on the precomputed buckets of the sessions
+        # (see schedule.py), so no inequality index is required
+        if startFrom is not None or startTo is not None:
+            blocks = startBlockCover(startFrom, startTo)
+            if not blocks:
+                return []
+            sessions = sessions.filter(Session.startBlocks.IN(blocks))
+        if maxDuration is not None:
+            limit = durationLimitFor(maxDuration)
+            if limit is not None:
+                sessions = sessions.filter(Session.durationLimits == limit)
+
+        # buckets are coarser than the requested bounds, trim the edges
+        return sorted(
+            [session for session in sessions
+             if (startFrom is None or session.startTime >= startFrom) and
+             (startTo is None or session.startTime <= startTo) and
+             (maxDuration is None or (session.duration or 0) <= maxDuration)],
+            key=lambda session: (session.date, session.startTime))
+
     def _addSessionToWishlist(self, websafeSessionKey):
         '''Adds a session to the user wishlist'''
 
@@ -588,11 +1080,48 @@ class ConferenceApi(remote.Service):
             # add session to wishlist, only if it was not previously added
             prof.sessionsWishlist.append(websafeSessionKey)
             prof.put()
+            bumpVersionOnCommit(PROFILE_VERSION_KEY % prof.key.id())
             return True
         else:
             # the session was already in the users wishlist
             return False
 
+    @staticmethod
+    def _cacheSessionIntervals(c_key):
+        """Build the interval index of the sessions in a conference & assign
+        it to memcache; used by createSession() & on cache misses.
+        """
+        intervals = [sessionInterval(session) for session in
+                     Session.query(ancestor=c_key)]
+        index = SessionIntervalIndex(
+            [interval for interval in intervals if interval])
+        memcache.set(MEMCACHE_SESSION_INTERVALS_PREFIX + c_key.urlsafe(),
+                     index)
+        return index
+
+    def _getSessionIntervals(self, c_keys):
+        """Return the interval indexes of the given conferences, by websafe
+        conference key. Indexes missing in memcache are rebuilt."""
+        wscks = [c_key.urlsafe() for c_key in c_keys]
+        indexes = memcache.get_multi(
+            wscks, key_prefix=MEMCACHE_SESSION_INTERVALS_PREFIX)
+        for c_key, wsck in zip(c_keys, wscks):
+            if wsck not in indexes:
+                indexes[wsck] = self._cacheSessionIntervals(c_key)
+        return indexes
+
+    def _getWishlistIndex(self, prof):
+        """Return an interval index over the sessions in the user wishlist."""
+        s_keys = [ndb.Key(urlsafe=wssk) for wssk in prof.sessionsWishlist]
+        # session timing is read from the cached conference indexes, so no
+        # session entity needs to be loaded
+        indexes = self._getSessionIntervals(
+            list(set(s_key.parent() for s_key in s_keys)))
+        intervals = [indexes[s_key.parent().urlsafe()].interval(wssk)
+                     for s_key, wssk in zip(s_keys, prof.sessionsWishlist)]
+        return SessionIntervalIndex(
+            [interval for interval in intervals if interval])
+
     @endpoints.method(SESSION_POST_REQUEST, SessionForm,
                       path='session/{websafeConferenceKey}',
                       http_method='PUT', name='createSession')
@@ -614,12 +1143,15 @@ class ConferenceApi(remote.Service):
         # create the session
         session = self._createSessionObject(request,
                                             request.websafeConferenceKey)
+        # rebuild the interval index of the conference sessions
+        self._cacheSessionIntervals(session.key.parent())
         if featuredSpeaker:
             # add featured speaker to memcache using a task
             speaker = Speaker.query(Speaker.email==request.speakerEmail).get()
-            featured_speaker_message = FEATURED_SPEAKER_MESSAGE % speaker.name
+            featured_speaker_message = (
+                announcements.FEATURED_SPEAKER_MESSAGE % speaker.name)
             taskqueue.add(
-                params={'key': MEMCACHE_FEATURED_SPEAKER_KEY, 'featured_speaker_message': featured_speaker_message},
+                params={'featured_speaker_message': featured_speaker_message},
                 url='/tasks/set_featured_speaker')
 
         return self._copySessionToForm(session)
@@ -630,11 +1162,16 @@ class ConferenceApi(remote.Service):
     def getConferenceSessions(self, request):
         """Query all sessions in a conference"""
 
-        # create ancestor query, using websafe conference key
-        sessions = Session.query(
-            ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        # check the ETag of the session list before querying
+        tag = etag(SESSIONS_VERSION_KEY % request.websafeConferenceKey)
+        if tag and tag == request.ifNoneMatch:
+            return SessionForms(etag=tag, notModified=True)
+
+        # read the agenda snapshot, with the speakers of the sessions
+        items = agenda.getAgenda(ndb.Key(urlsafe=request.websafeConferenceKey))
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=[SessionForm(**item) for item in items],
+            etag=tag
         )
 
     @endpoints.method(SESSIONS_GET_REQUEST_WITH_TYPE, SessionForms,
@@ -651,27 +1188,44 @@ class ConferenceApi(remote.Service):
             items=[self._copySessionToForm(session) for session in sessions]
         )
 
-    @endpoints.method(SpeakerForm, SessionForms,
+    @endpoints.method(SPEAKER_SESSIONS_GET_REQUEST, SessionForms,
                       path='sessions',
                       http_method='GET', name='getConferenceSessionsBySpeaker')
     def getConferenceSessionsBySpeaker(self, request):
-        """Query all sessions in a conference with a specific speaker"""
-
-        # ancestor query with filter for speaker
-        # speaker is identified with the email
-        sessions = Session.query(Session.speakerId == request.email)
+        """Query all sessions with a specific speaker, optionally only
+        those in one conference"""
+
+        # speaker is identified with the email; the speaker entity keeps
+        # the keys of its sessions (and is cached by ndb), so a single
+        # get_multi retrieves them
+        speaker = ndb.Key(Speaker, request.email).get() if request.email \
+            else None
+        if not speaker:
+            raise endpoints.NotFoundException(
+                'No speaker found with email: %s' % request.email)
+        session_keys = [ndb.Key(urlsafe=wssk) for wssk in speaker.sessionKeys]
+        if request.websafeConferenceKey:
+            c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+            session_keys = [s_key for s_key in session_keys
+                            if s_key.parent() == c_key]
+        sessions = ndb.get_multi(session_keys)
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=[self._copySessionToForm(session, speaker)
+                   for session in sessions if session]
         )
 
-    @endpoints.method(SESSION_GET_REQUEST, BooleanMessage,
+    @endpoints.method(SESSION_WISHLIST_REQUEST, WishlistMessage,
                       path='sessions/wishlist/{sessionKey}',
                       http_method='POST', name='addSessionToWishlist')
     def addSessionToWishlist(self, request):
         """Add a session to the wishlist of the user"""
-        # create ancestor query for all key matches for this user
-        return BooleanMessage(
-            data=self._addSessionToWishlist(request.sessionKey))
+        added = self._addSessionToWishlist(request.sessionKey)
+        conflicts = []
+        if request.reportConflicts:
+            # report the wishlisted sessions overlapping the added one
+            index = self._getWishlistIndex(self._getProfileFromUser())
+            conflicts = index.conflicts(request.sessionKey)
+        return WishlistMessage(data=added, conflictingSessionKeys=conflicts)
 
     @endpoints.method(message_types.VoidMessage, SessionForms,
                       path='sessions/wishlist',
@@ -686,12 +1240,46 @@ class ConferenceApi(remote.Service):
         prof = self._getProfileFromUser()
         session_keys = [ndb.Key(urlsafe=wssk) for wssk in
                         prof.sessionsWishlist]
-        # retrieve all sessions with one single query, using 'get_multi'
+        # retrieve all sessions with one single query, using 'get_multi';
+        # sessions of archived conferences are skipped
         sessions = ndb.get_multi(session_keys)
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=[self._copySessionToForm(session) for session in sessions
+                   if session]
         )
 
+    @endpoints.method(message_types.VoidMessage, StringMessage,
+                      path='sessions/wishlist/feed',
+                      http_method='GET', name='getWishlistFeedUrl')
+    def getWishlistFeedUrl(self, request):
+        """Return the URL of the iCalendar feed of the user's wishlist"""
+        prof = self._getProfileFromUser()
+        if not prof.feedToken:
+            prof.feedToken = feeds.makeToken(prof.key.id())
+            prof.put()
+        return StringMessage(data=feeds.WISHLIST_FEED_URL % prof.feedToken)
+
+    @endpoints.method(message_types.VoidMessage, SessionConflictForms,
+                      path='sessions/wishlist/conflicts',
+                      http_method='GET', name='getWishlistConflicts')
+    def getWishlistConflicts(self, request):
+        """Show wishlisted sessions that overlap other wishlisted sessions"""
+
+        # check user login
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        prof = self._getProfileFromUser()
+        index = self._getWishlistIndex(prof)
+        items = []
+        for wssk in prof.sessionsWishlist:
+            conflicts = index.conflicts(wssk)
+            if conflicts:
+                items.append(SessionConflictForm(
+                    websafeSessionKey=wssk,
+                    conflictingSessionKeys=conflicts))
+        return SessionConflictForms(items=items)
+
     @endpoints.method(message_types.VoidMessage, BooleanMessage,
                       path='sessions/wishlist/clear',
                       http_method='GET', name='clearSessionsWishlist')
@@ -711,6 +1299,7 @@ class ConferenceApi(remote.Service):
             retVal = False
         prof.sessionsWishlist = []
         prof.put()
+        bumpVersionOnCommit(PROFILE_VERSION_KEY % prof.key.id())
         return BooleanMessage(data=retVal)
 
     @endpoints.method(SESSIONS_GET_REQUEST_TIME, SessionForms,
@@ -719,8 +1308,7 @@ class ConferenceApi(remote.Service):
     def getMaxTimeSessions(self, request):
         """Query all sessions that last equal of less than a given duration"""
 
-        # query by filter
-        sessions = Session.query(Session.duration <= request.maxDuration)
+        sessions = self._querySessionsByTime(maxDuration=request.maxDuration)
         return SessionForms(
             items=[self._copySessionToForm(session) for session in sessions]
         )
@@ -731,24 +1319,35 @@ class ConferenceApi(remote.Service):
     def getConferenceSessionsInPeriod(self, request):
         """Query all sessions in a conference and in a specific perior"""
 
-        noon = datetime.strptime('12:00', "%H:%M").time()
-        startEvening = datetime.strptime('18:00', "%H:%M").time()
-
-        # query by ancestor
-        sessions = Session.query(
-            ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        # any other period returns all sessions in the conference
+        startFrom, startTo = [
+            datetime.strptime(t, "%H:%M").time() if t else None
+            for t in PERIODS.get(request.period, (None, None))]
+        sessions = self._querySessionsByTime(
+            ndb.Key(urlsafe=request.websafeConferenceKey), startFrom, startTo)
+        return SessionForms(
+            items=[self._copySessionToForm(session) for session in sessions]
+        )
 
-        # add filter to query
-        if (request.period == 'morning'):
-            sessions = sessions.filter(Session.startTime <= noon)
-        elif (request.period == 'afternoon'):
-            sessions = sessions.filter(Session.startTime > noon)
-            sessions = sessions.filter(Session.startTime <= startEvening)
-        elif (request.period == 'evening'):
-            sessions = sessions.filter(Session.startTime > startEvening)
+    @endpoints.method(SESSIONS_GET_REQUEST_RANGE, SessionForms,
+                      path='sessions/range',
+                      http_method='GET', name='getSessionsInTimeRange')
+    def getSessionsInTimeRange(self, request):
+        """Query sessions by start time window (HH:MM, both ends included)
+        and maximum duration, optionally within one conference"""
 
-        # order by startTime, so query is valid
-        sessions = sessions.order(Session.startTime)
+        try:
+            startFrom, startTo = [
+                datetime.strptime(t, "%H:%M").time() if t else None
+                for t in (request.startFrom, request.startTo)]
+        except ValueError:
+            raise endpoints.BadRequestException(
+                "Start times must be formatted as HH:MM")
+        c_key = None
+        if request.websafeConferenceKey:
+            c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        sessions = self._querySessionsByTime(
+            c_key, startFrom, startTo, request.maxDuration)
         return SessionForms(
             items=[self._copySessionToForm(session) for session in sessions]
         )
@@ -794,45 +1393,82 @@ class ConferenceApi(remote.Service):
                       http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(
-            data=memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY) or "")
+        return StringMessage(data=announcements.getFeaturedSpeaker())
 
-    # - - - Announcements - - - - - - - - - - - - - - - - - - - -
+    # - - - Speaker directory - - - - - - - - - - - - - - - - - -
 
-    @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = ANNOUNCEMENT_TPL % (
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+    def _copySpeakerToForm(self, speaker):
+        """Copy relevant fields from Speaker to SpeakerForm."""
+        sf = SpeakerForm()
+        for field in sf.all_fields():
+            if hasattr(speaker, field.name):
+                setattr(sf, field.name, getattr(speaker, field.name))
+        sf.check_initialized()
+        return sf
 
-        return announcement
+    @endpoints.method(SPEAKERS_GET_REQUEST, SpeakerForms,
+                      path='speakers',
+                      http_method='GET', name='getSpeakers')
+    def getSpeakers(self, request):
+        """List speakers by name, optionally those whose name starts with
+        the given prefix. Results are paginated with pageToken."""
+
+        pageSize = min(request.pageSize or SPEAKERS_PAGE_SIZE,
+                       SPEAKERS_MAX_PAGE_SIZE)
+        speakers = Speaker.query()
+        if request.namePrefix:
+            # prefix lookup as a range on the lowercase name
+            prefix = request.namePrefix.lower()
+            speakers = speakers.filter(Speaker.nameLower >= prefix,
+                                       Speaker.nameLower < prefix + u'\ufffd')
+        speakers = speakers.order(Speaker.nameLower)
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+        try:
+            cursor = Cursor(urlsafe=request.pageToken)
+        except Exception:
+            raise endpoints.BadRequestException('Invalid page token')
+        items, next_cursor, more = speakers.fetch_page(pageSize,
+                                                       start_cursor=cursor)
+        return SpeakerForms(
+            items=[self._copySpeakerToForm(speaker) for speaker in items],
+            nextPageToken=next_cursor.urlsafe() if more and next_cursor
+            else None
+        )
+
+    # - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+    @endpoints.method(CONDITIONAL_GET_REQUEST, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        return StringMessage(
-            data=memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or "")
+        announcement = announcements.getAnnouncement()
+        tag = contentEtag(announcement)
+        if tag == request.ifNoneMatch:
+            return StringMessage(data="", etag=tag, notModified=True)
+        return StringMessage(data=announcement, etag=tag)
 
     # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
+    def _getLiveConference(self, wsck):
+        """Return the live conference of a websafe key. Archived conferences
+        (archive.py) have ended, so their seats can not change."""
+        try:
+            c_key = ndb.Key(urlsafe=wsck)
+        except Exception:
+            c_key = None
+        conf = None
+        if c_key and c_key.kind() == Conference.__name__:
+            conf = c_key.get()
+            if not conf and archive.archivedKey(c_key).get():
+                c_key = archive.archivedKey(c_key)
+        if c_key and c_key.kind() == ArchivedConference.__name__:
+            raise ConflictException("This conference has ended.")
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        return conf
+
     @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
         """Register or unregister user for selected conference."""
@@ -842,10 +1478,7 @@ class ConferenceApi(remote.Service):
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
-        conf = ndb.Key(urlsafe=wsck).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % wsck)
+        conf = self._getLiveConference(wsck)
 
         # register
         if reg:
@@ -857,11 +1490,13 @@ class ConferenceApi(remote.Service):
             # check if seats avail
             if conf.seatsAvailable <= 0:
                 raise ConflictException(
-                    "There are no seats available.")
+                    "There are no seats available. "
+                    "Join the waitlist to get a seat when one frees up.")
 
             # register user, take away one seat
             prof.conferenceKeysToAttend.append(wsck)
             conf.seatsAvailable -= 1
+            analytics.record(analytics.seatDeltas(conf, -1))
             retval = True
 
         # unregister
@@ -872,6 +1507,9 @@ class ConferenceApi(remote.Service):
                 # unregister user, add back one seat
                 prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
+                analytics.record(analytics.seatDeltas(conf, 1))
+                # give the seat to the first user waiting for one
+                waitlist.record(wsck)
                 retval = True
             else:
                 retval = False
@@ -879,6 +1517,8 @@ class ConferenceApi(remote.Service):
         # write things back to the datastore & return
         prof.put()
         conf.put()
+        bumpVersionOnCommit(PROFILE_VERSION_KEY % prof.key.id())
+        bumpVersionOnCommit(CONFERENCE_VERSION_KEY % wsck)
         return BooleanMessage(data=retval)
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -890,26 +1530,29 @@ class ConferenceApi(remote.Service):
         conf_keys = [ndb.Key(urlsafe=wsck) for wsck in
                      prof.conferenceKeysToAttend]
         conferences = ndb.get_multi(conf_keys)
-
-        # get organizers
-        organisers = [ndb.Key(Profile, conf.organizerUserId) for conf in
-                      conferences]
-        profiles = ndb.get_multi(organisers)
-
-        # put display names in a dict for easier fetching
-        names = {}
-        for profile in profiles:
-            names[profile.key.id()] = profile.displayName
+        # conferences that ended are read from the archive (archive.py)
+        missing = [c_key for c_key, conf in zip(conf_keys, conferences)
+                   if not conf]
+        archived = dict(zip(missing, ndb.get_multi(
+            [archive.archivedKey(c_key) for c_key in missing])))
+        conferences = [conf or archived.get(c_key)
+                       for c_key, conf in zip(conf_keys, conferences)]
+        conferences = [conf for conf in conferences if conf]
+
+        # get organizer display names, cached in the instance (namecache.py)
+        names = namecache.getOrganizerNames(
+            [conf.organizerUserId for conf in conferences])
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(items=[
-            self._copyConferenceToForm(conf, names[conf.organizerUserId]) \
+            self._copyConferenceToForm(conf, names.get(conf.organizerUserId)) \
             for conf in conferences]
                                )
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
                       http_method='POST', name='registerForConference')
+    @ratelimit.limited
     def registerForConference(self, request):
         """Register user for selected conference."""
         return self._conferenceRegistration(request)
@@ -917,10 +1560,85 @@ class ConferenceApi(remote.Service):
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
                       http_method='DELETE', name='unregisterFromConference')
+    @ratelimit.limited
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
+    # - - - Waitlist - - - - - - - - - - - - - - - - - - - - - - -
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistForm,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='POST', name='joinWaitlist')
+    def joinWaitlist(self, request):
+        """Join the waitlist of a sold out conference."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        conf = self._getLiveConference(wsck)
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+        if conf.seatsAvailable > 0:
+            raise ConflictException(
+                "There are seats available; register for the conference.")
+        waitlist.join(wsck, prof.key.id())
+        return WaitlistForm(websafeConferenceKey=wsck,
+                            position=waitlist.position(wsck, prof.key.id()))
+
+    @endpoints.method(CONF_GET_REQUEST, WaitlistForm,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='GET', name='getWaitlistPosition')
+    def getWaitlistPosition(self, request):
+        """Return the position of the user in the waitlist of a conference,
+        0 if not waiting."""
+        prof = self._getProfileFromUser()
+        wsck = request.websafeConferenceKey
+        return WaitlistForm(websafeConferenceKey=wsck,
+                            position=waitlist.position(wsck, prof.key.id()))
+
+    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+                      path='conference/{websafeConferenceKey}/waitlist',
+                      http_method='DELETE', name='leaveWaitlist')
+    def leaveWaitlist(self, request):
+        """Leave the waitlist of a conference."""
+        prof = self._getProfileFromUser()
+        waitlist.leave(request.websafeConferenceKey, prof.key.id())
+        return BooleanMessage(data=True)
+
+    # - - - Admin - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _checkAdmin(self):
+        """Raise unless the current user is an admin (settings.ADMIN_EMAILS)."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        if user.email() not in ADMIN_EMAILS:
+            raise endpoints.ForbiddenException('Admin access required')
+
+    @endpoints.method(message_types.VoidMessage, AnalyticsForms,
+                      path='admin/analytics',
+                      http_method='GET', name='getConferenceAnalytics')
+    def getConferenceAnalytics(self, request):
+        """Return conference aggregates by city, month and topic."""
+        self._checkAdmin()
+        items = []
+        for dimension, values in sorted(analytics.getStats().items()):
+            for value, counters in sorted(values.items()):
+                conferences = counters.get('conferences', 0)
+                capacity = counters.get('capacity', 0)
+                seats = counters.get('seatsAvailable', 0)
+                sessions = counters.get('sessions', 0)
+                items.append(AnalyticsForm(
+                    dimension=dimension, value=value,
+                    conferences=conferences, capacity=capacity,
+                    seatsRemaining=seats,
+                    fillRate=(float(capacity - seats) / capacity
+                              if capacity else 0.0),
+                    sessions=sessions,
+                    sessionsPerConference=(float(sessions) / conferences
+                                           if conferences else 0.0)))
+        return AnalyticsForms(items=items)
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='filterPlayground',
                       http_method='GET', name='filterPlayground')
@@ -941,4 +1659,5 @@ class ConferenceApi(remote.Service):
         )
 
 
-api = endpoints.api_server([ConferenceApi])  # register API
+api = profiling.middleware(
+    endpoints.api_server([ConferenceApi]))  # register API
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""etags.py
+
+Udacity conference server-side Python App Engine version counters & ETags
+
+Every cacheable resource has a version counter in memcache, bumped by the
+write paths that change it. ETags are built from the counters only, so a
+conditional request can be answered without loading any entity.
+
+"""
+
+import hashlib
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+CONFERENCE_VERSION_KEY = "CONFERENCE_VERSION_%s"
+SESSIONS_VERSION_KEY = "SESSIONS_VERSION_%s"
+PROFILE_VERSION_KEY = "PROFILE_VERSION_%s"
+FEATURED_SPEAKER_VERSION_KEY = "FEATURED_SPEAKER_VERSION"
+
+
+def _initialVersion():
+    """Return the first version of a counter missing in memcache.
+
+    Counters start from the current time in milliseconds, so a counter
+    evicted from memcache never goes back to a version seen before.
+    """
+    return int(time.time() * 1000)
+
+
+def getVersions(keys):
+    """Return the versions of the given counters, creating missing ones."""
+    versions = memcache.get_multi(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        initial = _initialVersion()
+        memcache.add_multi(dict((key, initial) for key in missing))
+        versions.update(memcache.get_multi(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bumpVersion(key):
+    """Increment a version counter."""
+    memcache.incr(key, initial_value=_initialVersion())
+
+
+def bumpVersionOnCommit(key):
+    """Increment a version counter once the current transaction commits,
+    or right away when not in a transaction."""
+    ndb.get_context().call_on_commit(lambda: bumpVersion(key))
+
+
+def etag(*keys):
+    """Return the ETag of a resource built from the given counters, or None
+    if memcache is not available."""
+    versions = getVersions(list(keys))
+    if None in versions:
+        return None
+    return '"%s"' % '.'.join(str(version) for version in versions)
+
+
+def contentEtag(content):
+    """Return the ETag of a resource built from its content."""
+    return '"%s"' % hashlib.md5(content.encode('utf-8')).hexdigest()
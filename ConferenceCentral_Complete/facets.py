@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""facets.py
+
+Udacity conference server-side Python App Engine conference facet counts
+
+The conference browser filters on city, topic and month. For each
+combination of equality filters a conference matches (a 'cell'), the
+number of conferences per city, topic and month value is kept in a few
+sharded FacetCounts entities. A conference with n topics is in 4 * (n + 1)
+cells: no filter, its city, its month, each of its topics and their
+combinations. Write paths record deltas in a task; reads merge the shards
+of one cell from a single get and are cached in memcache. A periodic job
+recomputes every cell to correct any drift.
+
+"""
+
+import hashlib
+import itertools
+import json
+import random
+import uuid
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import FacetCounts
+
+SHARDS = 5
+FIELDS = ('city', 'topic', 'month')
+# entity groups written by one cross-group transaction at most
+MAX_CELLS_PER_TASK = 25
+MEMCACHE_FACETS_PREFIX = "FACETS_"
+CACHE_SECONDS = 600
+# conferences read per datastore batch when recomputing
+RECOMPUTE_BATCH_SIZE = 500
+
+
+def conferenceValues(conf):
+    """Return the (field, value) pairs of a conference, values as strings."""
+    values = []
+    if conf.city:
+        values.append(('city', conf.city))
+    if conf.month:
+        values.append(('month', str(conf.month)))
+    values.extend(('topic', topic) for topic in conf.topics or [])
+    return values
+
+
+def cellId(filters):
+    """Return the id of the cell of some {field: value} equality filters."""
+    return json.dumps(sorted(filters.items()))
+
+
+def conferenceCells(conf):
+    """Return the ids of the cells a conference is counted in."""
+    choices = [[None, (field, value)] for field, value in
+               conferenceValues(conf) if field != 'topic']
+    choices.append([None] + [('topic', topic)
+                             for topic in conf.topics or []])
+    return [cellId(dict(pair for pair in combination if pair))
+            for combination in itertools.product(*choices)]
+
+
+def conferenceDeltas(conf, sign=1):
+    """Return the deltas adding (or with sign -1, removing) a conference."""
+    values = conferenceValues(conf)
+    return [(cell, field, value, sign)
+            for cell in conferenceCells(conf)
+            for field, value in values]
+
+
+def _merge(counts, deltas):
+    """Add (field, value, amount) deltas to a {field: {value: count}} dict."""
+    for field, value, amount in deltas:
+        values = counts.setdefault(field, {})
+        values[value] = values.get(value, 0) + amount
+    return counts
+
+
+def _cellKeys(cell):
+    return [ndb.Key(FacetCounts, '%d:%s' % (shard, cell))
+            for shard in range(SHARDS)]
+
+
+def _cacheKey(cell):
+    # cell ids may be longer than memcache keys allow
+    return (MEMCACHE_FACETS_PREFIX +
+            hashlib.md5(cell.encode('utf-8')).hexdigest())
+
+
+def record(deltas):
+    """Record deltas in the background; when called in a transaction they
+    are only recorded if it commits. Deltas that cancel out are dropped."""
+    totals = {}
+    for cell, field, value, amount in deltas:
+        delta = (cell, field, value)
+        totals[delta] = totals.get(delta, 0) + amount
+    deltas = [delta + (amount,) for delta, amount in totals.items()
+              if amount]
+    if deltas:
+        taskqueue.add(url='/tasks/record_facets',
+                      params={'deltas': json.dumps(deltas),
+                              'changeId': uuid.uuid4().hex},
+                      transactional=ndb.in_transaction())
+
+
+def applyDeltas(deltas, changeId):
+    """Add deltas to a random shard of their cells.
+
+    Deltas spanning more cells than one transaction may write are split
+    into named tasks, so a retried task does not apply any part twice.
+    """
+    byCell = {}
+    for cell, field, value, amount in deltas:
+        byCell.setdefault(cell, []).append((field, value, amount))
+    if len(byCell) <= MAX_CELLS_PER_TASK:
+        _applyCells(byCell)
+        memcache.delete_multi([_cacheKey(cell) for cell in byCell])
+        return
+
+    cells = sorted(byCell)
+    tasks = []
+    for i in range(0, len(cells), MAX_CELLS_PER_TASK):
+        part = [(cell,) + delta for cell in cells[i:i + MAX_CELLS_PER_TASK]
+                for delta in byCell[cell]]
+        tasks.append(taskqueue.Task(
+            url='/tasks/record_facets',
+            name='facets-%s-%d' % (changeId, i // MAX_CELLS_PER_TASK),
+            params={'deltas': json.dumps(part), 'changeId': changeId}))
+    try:
+        taskqueue.Queue().add(tasks)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+@ndb.transactional(xg=True)
+def _applyCells(byCell):
+    shard = random.randrange(SHARDS)
+    keys = [_cellKeys(cell)[shard] for cell in byCell]
+    entities = ndb.get_multi(keys)
+    for i, cell in enumerate(byCell):
+        entity = entities[i] or FacetCounts(key=keys[i])
+        entity.counts = _merge(dict(entity.counts or {}), byCell[cell])
+        entities[i] = entity
+    ndb.put_multi(entities)
+
+
+def getFacets(filters=None):
+    """Return the {field: {value: count}} counts of the conferences
+    matching some {field: value} equality filters, from cache."""
+    cell = cellId(filters or {})
+    counts = memcache.get(_cacheKey(cell))
+    if counts is None:
+        counts = {}
+        for entity in ndb.get_multi(_cellKeys(cell)):
+            if entity and entity.counts:
+                for field, values in entity.counts.items():
+                    _merge(counts, [(field, value, count)
+                                    for value, count in values.items()])
+        memcache.set(_cacheKey(cell), counts, time=CACHE_SECONDS)
+    return counts
+
+
+def recompute():
+    """Recompute every cell from the conferences, write them to the first
+    shard and delete the other shards & the cells no longer used.
+
+    Deltas applied while recomputing may be lost; the next run corrects
+    them.
+    """
+    counts = {}
+    for conf in Conference.query().iter(batch_size=RECOMPUTE_BATCH_SIZE):
+        for cell, field, value, amount in conferenceDeltas(conf):
+            _merge(counts.setdefault(cell, {}), [(field, value, amount)])
+    entities = [FacetCounts(key=_cellKeys(cell)[0], counts=cellCounts)
+                for cell, cellCounts in counts.items()]
+    written = set(entity.key for entity in entities)
+    for i in range(0, len(entities), RECOMPUTE_BATCH_SIZE):
+        ndb.put_multi(entities[i:i + RECOMPUTE_BATCH_SIZE])
+    stale = [key for key in FacetCounts.query().iter(keys_only=True)
+             if key not in written]
+    for i in range(0, len(stale), RECOMPUTE_BATCH_SIZE):
+        ndb.delete_multi(stale[i:i + RECOMPUTE_BATCH_SIZE])
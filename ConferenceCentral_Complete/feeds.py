@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+
+"""feeds.py
+
+Udacity conference server-side Python App Engine iCalendar feeds
+
+Conference agendas and user wishlists are published as iCalendar feeds
+for calendar clients to poll. A rendered feed is cached in memcache with
+the versions of what it was rendered from: the session list version of
+the conference, or the profile version of the user and the session list
+versions of the conferences of the wishlisted sessions. The feed and the
+versions known up front are read with one get_multi, so a poll of an
+unchanged agenda feed costs a single memcache call (a wishlist feed
+takes another for the session list versions). The ETag of a feed is built from its versions.
+
+Wishlist feeds are addressed by a secret token, as calendar clients can
+not sign in; the token starts with the encoded user id so the profile
+version can be found without reading the profile.
+
+"""
+
+import base64
+from datetime import datetime
+from datetime import timedelta
+import uuid
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Profile
+import agenda
+
+from etags import PROFILE_VERSION_KEY
+from etags import SESSIONS_VERSION_KEY
+from etags import contentEtag
+from etags import getVersions
+
+MEMCACHE_FEED_PREFIX = "ICAL_FEED_"
+CONFERENCE_FEED_URL = '/feeds/conference/%s.ics'
+WISHLIST_FEED_URL = '/feeds/wishlist/%s.ics'
+PRODID = '-//Udacity//Conference Central//EN'
+UID_DOMAIN = 'conference-central'
+# octets per content line, CRLF excluded (RFC 5545)
+LINE_LENGTH = 75
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Split a content line in lines of at most LINE_LENGTH octets, never
+    in the middle of a UTF-8 sequence."""
+    data = line.encode('utf-8')
+    lines = []
+    while len(data) > LINE_LENGTH:
+        cut = LINE_LENGTH - (1 if lines else 0)
+        while cut and (ord(data[cut:cut + 1]) & 0xC0) == 0x80:
+            cut -= 1
+        lines.append(data[:cut])
+        data = data[cut:]
+    lines.append(data)
+    return b'\r\n '.join(lines).decode('utf-8')
+
+
+def _event(item, stamp):
+    """Return the lines of the VEVENT of an agenda item, or [] if the
+    session has no date."""
+    if not item['date']:
+        return []
+    start = datetime.strptime('%s %s' % (item['date'],
+                                         item['startTime'] or '00:00:00'),
+                              '%Y-%m-%d %H:%M:%S')
+    end = start + timedelta(minutes=item['duration'] or 0)
+    description = ['Speaker: %s' % (item['speakerName'] or
+                                    item['speakerEmail'])]
+    if item['typeOfSession']:
+        description.append('Type: %s' % item['typeOfSession'])
+    description.extend(item['highlights'] or [])
+    # times are floating: they are local to the conference
+    return ['BEGIN:VEVENT',
+            'UID:%s@%s' % (item['websafeSessionKey'], UID_DOMAIN),
+            'DTSTAMP:%s' % stamp,
+            'DTSTART:%s' % start.strftime('%Y%m%dT%H%M%S'),
+            'DTEND:%s' % end.strftime('%Y%m%dT%H%M%S'),
+            'SUMMARY:%s' % _escape(item['name']),
+            'DESCRIPTION:%s' % _escape('\n'.join(description)),
+            'END:VEVENT']
+
+
+def renderCalendar(name, items):
+    """Return the iCalendar document of some agenda items."""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:%s' % PRODID,
+             'CALSCALE:GREGORIAN', 'X-WR-CALNAME:%s' % _escape(name)]
+    for item in items:
+        lines.extend(_event(item, stamp))
+    lines.append('END:VCALENDAR')
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def makeToken(user_id):
+    """Return a new secret wishlist feed token of a user."""
+    return '%s.%s' % (base64.urlsafe_b64encode(user_id.encode('utf-8'))
+                      .rstrip(b'=').decode('ascii'), uuid.uuid4().hex)
+
+
+def _tokenUserId(token):
+    encoded = token.split('.', 1)[0]
+    try:
+        return base64.urlsafe_b64decode(
+            str(encoded + '=' * (-len(encoded) % 4))).decode('utf-8')
+    except (TypeError, ValueError):
+        return None
+
+
+def _readVersions(versionKeys, cached):
+    """Return the versions of some counters, from the values of a
+    get_multi when they were in it."""
+    missing = [key for key in versionKeys if cached.get(key) is None]
+    if missing:
+        cached = dict(cached)
+        cached.update(zip(missing, getVersions(missing)))
+    return [cached.get(key) for key in versionKeys]
+
+
+def _cachedFeed(feedId, versionKeys, render):
+    """Return the (etag, body) of a feed, rendering it only if the cached
+    copy is missing or older than the versions.
+
+    render returns None if there is no such feed, or (body, {counter:
+    version}) of the further counters the feed depends on, read before
+    what the body was rendered from; the cached feed lists them.
+    """
+    cacheKey = MEMCACHE_FEED_PREFIX + feedId
+    cached = memcache.get_multi([cacheKey] + versionKeys)
+    feed = cached.get(cacheKey)
+    versions = _readVersions(versionKeys, cached)
+    feedKeys = feed.get('versionKeys', []) if feed else []
+    if feedKeys[:len(versionKeys)] == versionKeys:
+        more = feedKeys[len(versionKeys):]
+        if feed['versions'] == versions + _readVersions(more, {}):
+            return feed['etag'], feed['body']
+
+    rendered = render()
+    if rendered is None:
+        return None
+    body, depends = rendered
+    more = sorted(depends)
+    versions += [depends[key] for key in more]
+    tag = contentEtag('.'.join(str(version) for version in versions))
+    if None not in versions:
+        memcache.set(cacheKey, {'versionKeys': versionKeys + more,
+                                'versions': versions, 'etag': tag,
+                                'body': body})
+    return tag, body
+
+
+def conferenceFeed(websafeConferenceKey):
+    """Return the (etag, body) of the agenda feed of a conference, or None
+    if there is no such conference."""
+    def render():
+        try:
+            c_key = ndb.Key(urlsafe=websafeConferenceKey)
+            if c_key.kind() != Conference.__name__:
+                return None
+            conf = c_key.get()
+        except Exception:
+            return None
+        if not conf:
+            return None
+        return renderCalendar(conf.name, agenda.getAgenda(c_key)), {}
+    return _cachedFeed('conference:%s' % websafeConferenceKey,
+                       [SESSIONS_VERSION_KEY % websafeConferenceKey], render)
+
+
+def wishlistFeed(token):
+    """Return the (etag, body) of the wishlist feed of a token, or None if
+    the token is not valid."""
+    user_id = _tokenUserId(token)
+    if not user_id:
+        return None
+
+    def render():
+        prof = ndb.Key(Profile, user_id).get()
+        if not prof or prof.feedToken != token:
+            return None
+        # wishlisted sessions, from the agendas of their conferences; the
+        # feed also changes with the sessions of those conferences
+        s_keys = [ndb.Key(urlsafe=wssk) for wssk in prof.sessionsWishlist]
+        wishlist = set(prof.sessionsWishlist)
+        c_keys = sorted(set(s_key.parent() for s_key in s_keys))
+        sessionKeys = [SESSIONS_VERSION_KEY % c_key.urlsafe()
+                       for c_key in c_keys]
+        depends = dict(zip(sessionKeys, getVersions(sessionKeys)))
+        items = []
+        for c_key in c_keys:
+            items.extend(item for item in agenda.getAgenda(c_key)
+                         if item['websafeSessionKey'] in wishlist)
+        return renderCalendar('%s - wishlist' % (prof.displayName or
+                                                 'Conference Central'),
+                              items), depends
+    return _cachedFeed('wishlist:%s' % token, [PROFILE_VERSION_KEY % user_id],
+                       render)
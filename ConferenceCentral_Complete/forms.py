@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""forms.py
+
+Udacity conference server-side Python App Engine ProtoRPC messages & API
+exceptions
+
+Split from models.py, so the task, cron & admin handlers of main.py load
+the datastore models without Cloud Endpoints & ProtoRPC.
+
+"""
+
+import httplib
+import endpoints
+from protorpc import messages
+
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
+class TooManyRequestsException(endpoints.ServiceException):
+    """TooManyRequestsException -- exception mapped to HTTP 429 response"""
+    http_status = 429
+
+class ProfileMiniForm(messages.Message):
+    """ProfileMiniForm -- update Profile form message"""
+    displayName = messages.StringField(1)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 2)
+
+class ProfileForm(messages.Message):
+    """ProfileForm -- Profile outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+    conferenceKeysToAttend = messages.StringField(4, repeated=True)
+    sessionsWishlist = messages.StringField(5, repeated=True)
+    etag = messages.StringField(6)
+    notModified = messages.BooleanField(7)
+
+class StringMessage(messages.Message):
+    """StringMessage-- outbound (single) string message"""
+    data = messages.StringField(1, required=True)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
+
+class BooleanMessage(messages.Message):
+    """BooleanMessage-- outbound Boolean value message"""
+    data = messages.BooleanField(1)
+
+class ConferenceForm(messages.Message):
+    """ConferenceForm -- Conference outbound form message"""
+    name            = messages.StringField(1)
+    description     = messages.StringField(2)
+    organizerUserId = messages.StringField(3)
+    topics          = messages.StringField(4, repeated=True)
+    city            = messages.StringField(5)
+    startDate       = messages.StringField(6) #DateTimeField()
+    month           = messages.IntegerField(7)
+    maxAttendees    = messages.IntegerField(8)
+    seatsAvailable  = messages.IntegerField(9)
+    endDate         = messages.StringField(10) #DateTimeField()
+    websafeKey      = messages.StringField(11)
+    organizerDisplayName = messages.StringField(12)
+    etag            = messages.StringField(13)
+    notModified     = messages.BooleanField(14)
+
+class ConferenceForms(messages.Message):
+    """ConferenceForms -- multiple Conference outbound form message"""
+    items = messages.MessageField(ConferenceForm, 1, repeated=True)
+
+class TeeShirtSize(messages.Enum):
+    """TeeShirtSize -- t-shirt size enumeration value"""
+    NOT_SPECIFIED = 1
+    XS_M = 2
+    XS_W = 3
+    S_M = 4
+    S_W = 5
+    M_M = 6
+    M_W = 7
+    L_M = 8
+    L_W = 9
+    XL_M = 10
+    XL_W = 11
+    XXL_M = 12
+    XXL_W = 13
+    XXXL_M = 14
+    XXXL_W = 15
+
+class ConferenceQueryForm(messages.Message):
+    """ConferenceQueryForm -- Conference query inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+class ConferenceQueryForms(messages.Message):
+    """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
+    filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    # search the archived conferences instead of the live ones (archive.py)
+    archived = messages.BooleanField(2)
+
+class SessionMiniForm(messages.Message):
+    """SessionMiniForm -- message for creating sessions"""
+
+    name          = messages.StringField(1)
+    highlights    = messages.StringField(2, repeated=True)
+    # the form stores the complete speaker information, instead of just the id
+    speakerName   = messages.StringField(3)
+    speakerEmail  = messages.StringField(4)
+    duration      = messages.IntegerField(5)
+    typeOfSession = messages.StringField(6)
+    date          = messages.StringField(7)
+    startTime     = messages.StringField(8)
+
+class SessionForm(messages.Message):
+    """SessionForm -- Session outbound form message"""
+
+    name          = messages.StringField(1)
+    highlights    = messages.StringField(2, repeated=True)
+    # the form stores the complete speaker information, instead of just the id
+    speakerName   = messages.StringField(3)
+    speakerEmail  = messages.StringField(4)
+    duration      = messages.IntegerField(5)
+    typeOfSession = messages.StringField(6)
+    date          = messages.StringField(7)
+    startTime     = messages.StringField(8)
+    # key of the conference hosting this session
+    websafeConferenceKey = messages.StringField(9)
+    # key of the session itself
+    websafeSessionKey = messages.StringField(10)
+
+class SessionForms(messages.Message):
+    """SessionForms -- multiple Session outbound form message"""
+
+    # store a list of session forms
+    items = messages.MessageField(SessionForm, 1, repeated=True)
+    # version of the session list, for conditional requests
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
+
+class ChangesForm(messages.Message):
+    """ChangesForm -- conferences & sessions changed since a sync token"""
+
+    conferences = messages.MessageField(ConferenceForm, 1, repeated=True)
+    sessions    = messages.MessageField(SessionForm, 2, repeated=True)
+    # websafe keys of the conferences & sessions deleted
+    deletedKeys = messages.StringField(3, repeated=True)
+    # token of the next page, or of the next sync on the last page
+    nextToken   = messages.StringField(4)
+    # True if more pages follow
+    more        = messages.BooleanField(5)
+    # True if the client must drop its copy before applying the changes
+    fullSync    = messages.BooleanField(6)
+
+class SpeakerForm(messages.Message):
+    """SpeakerForm -- Speaker outbound form message"""
+
+    # fields resemble those of kind Speaker
+    name  = messages.StringField(1)
+    email = messages.StringField(2)
+    sessionCount   = messages.IntegerField(3)
+    conferenceKeys = messages.StringField(4, repeated=True)
+
+class SpeakerForms(messages.Message):
+    """SpeakerForms -- multiple Speaker outbound form message"""
+
+    items = messages.MessageField(SpeakerForm, 1, repeated=True)
+    # token to request the next page, empty on the last page
+    nextPageToken = messages.StringField(2)
+
+class SessionConflictForm(messages.Message):
+    """SessionConflictForm -- wishlist sessions overlapping a session"""
+
+    # key of the wishlisted session
+    websafeSessionKey = messages.StringField(1)
+    # keys of the other wishlisted sessions overlapping it
+    conflictingSessionKeys = messages.StringField(2, repeated=True)
+
+class SessionConflictForms(messages.Message):
+    """SessionConflictForms -- multiple SessionConflictForm outbound message"""
+
+    items = messages.MessageField(SessionConflictForm, 1, repeated=True)
+
+class WishlistMessage(messages.Message):
+    """WishlistMessage -- outbound result of adding a session to the wishlist"""
+
+    # whether the session was added to the wishlist
+    data = messages.BooleanField(1)
+    # wishlisted sessions overlapping the added one, if requested
+    conflictingSessionKeys = messages.StringField(2, repeated=True)
+
+class ConferenceDetailForm(messages.Message):
+    """ConferenceDetailForm -- conference with the state of the caller and
+    the first sessions of its agenda"""
+
+    conference   = messages.MessageField(ConferenceForm, 1)
+    # registration & wishlist state of the caller, if signed in
+    isAttending  = messages.BooleanField(2)
+    wishlistSessionKeys = messages.StringField(3, repeated=True)
+    waitlistPosition    = messages.IntegerField(4)
+    featuredSpeaker     = messages.StringField(5)
+    # first sessions of the agenda, and the number of sessions in it
+    sessions     = messages.MessageField(SessionForm, 6, repeated=True)
+    sessionCount = messages.IntegerField(7)
+    etag         = messages.StringField(8)
+    notModified  = messages.BooleanField(9)
+
+class WaitlistForm(messages.Message):
+    """WaitlistForm -- position of the user in a conference waitlist"""
+
+    websafeConferenceKey = messages.StringField(1)
+    # starts at 1; 0 when the user is not waiting
+    position = messages.IntegerField(2)
+
+class FacetForm(messages.Message):
+    """FacetForm -- number of conferences with one value of a field"""
+
+    # 'CITY', 'TOPIC' or 'MONTH', as in ConferenceQueryForm
+    field = messages.StringField(1)
+    value = messages.StringField(2)
+    count = messages.IntegerField(3)
+
+class FacetForms(messages.Message):
+    """FacetForms -- multiple FacetForm outbound form message"""
+
+    items = messages.MessageField(FacetForm, 1, repeated=True)
+
+class AnalyticsForm(messages.Message):
+    """AnalyticsForm -- conference aggregates for one dimension value"""
+
+    # 'city', 'month' (YYYY-MM) or 'topic'
+    dimension      = messages.StringField(1)
+    value          = messages.StringField(2)
+    conferences    = messages.IntegerField(3)
+    capacity       = messages.IntegerField(4)
+    seatsRemaining = messages.IntegerField(5)
+    # registered attendees / capacity
+    fillRate       = messages.FloatField(6)
+    sessions       = messages.IntegerField(7)
+    sessionsPerConference = messages.FloatField(8)
+
+class AnalyticsForms(messages.Message):
+    """AnalyticsForms -- multiple AnalyticsForm outbound form message"""
+
+    items = messages.MessageField(AnalyticsForm, 1, repeated=True)
@@ -2,7 +2,8 @@
 
 """
 main.py -- Udacity conference server-side Python App Engine
-    HTTP controller handlers for memcache & task queue access
+    HTTP controller handlers for memcache & task queue access;
+    does not import the Cloud Endpoints API, to keep instance startup cheap
 
 $Id$
 
@@ -12,22 +13,106 @@ created by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
+import cgi
+from datetime import datetime
+import json
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
-from google.appengine.api import memcache
-from conference import ConferenceApi
+from google.appengine.ext import ndb
+from models import Conference
+from models import MapperJob
+from models import ProfileRecord
+from models import Session
+from models import Speaker
+import agenda
+import analytics
+import announcements
+import archive
+import facets
+import feeds
+import mapper
+import namecache
+import notifications
+import profiling
+import querycache
+import ratemetrics
+import recommendations
+import speakers
+import sync
+import waitlist
+import warmup
+
+# notification batches delivered per cron run at most
+MAX_NOTIFICATION_BATCHES = 20
+
+
+# - - - Schema backfill transforms (see mapper.py) - - - - - - - - -
+
+def _resave(entity):
+    """Write the entity back, refreshing its computed properties."""
+    return True
+
+
+def _conferenceMonth(conf):
+    """Derive the conference month from its start date."""
+    month = conf.startDate.month if conf.startDate else 0
+    if conf.month == month:
+        return False
+    conf.month = month
+    return True
+
+
+def _speakerAggregates(session):
+    """Add the session to the speaker directory aggregates."""
+    if session.speakerId:
+        speakers.addSessionToSpeaker(ndb.Key(Speaker, session.speakerId),
+                                     session.key)
+    return False
+
+
+def _buildAgenda(conf):
+    """Build the agenda snapshot of the conference."""
+    agenda.rebuild(conf.key)
+    return False
+
+
+def _indexTopics(conf):
+    """Put the conference in the topic index of the recommendations."""
+    recommendations.indexConference(conf)
+    return False
+
+
+mapper.register('sessionBuckets', Session, _resave)
+mapper.register('speakerNames', Speaker, _resave)
+mapper.register('speakerAggregates', Session, _speakerAggregates)
+mapper.register('conferenceMonth', Conference, _conferenceMonth)
+mapper.register('conferenceBuckets', Conference, _resave)
+mapper.register('conferenceModified', Conference, _resave)
+mapper.register('sessionModified', Session, _resave)
+mapper.register('topicIndex', Conference, _indexTopics)
+mapper.register('agendas', Conference, _buildAgenda)
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Import the API modules & prime memcache on a new instance."""
+        warmup.warmup()
+        self.response.set_status(204)
+
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
-        ConferenceApi._cacheAnnouncement()
+        announcements.cacheAnnouncement()
         self.response.set_status(204)
 
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
+        """Send email confirming Conference creation. Confirmations are now
+        batched through notifications; kept for tasks already enqueued."""
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -41,12 +126,276 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
 
 class SetFeaturedSpeaker(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
-        memcache.set(self.request.get('key'), self.request.get('featured_speaker_message'))
+        """Set Featured Speaker in Memcache."""
+        announcements.setFeaturedSpeaker(
+            self.request.get('featured_speaker_message'))
+
+
+class NotifyAttendeesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Notify a batch of attendees of a conference change."""
+        notifications.notifyAttendees(
+            self.request.get('websafeConferenceKey'),
+            self.request.get('changeId'),
+            json.loads(self.request.get('data')),
+            batch=int(self.request.get('batch') or 0),
+            cursor=self.request.get('cursor') or None)
+
+
+class RecordAnalyticsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Add conference analytics deltas to a shard."""
+        analytics.applyDeltas(json.loads(self.request.get('deltas')),
+                              self.request.get('changeId'))
+
+
+class RecordFacetsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Add conference facet count deltas to their cells."""
+        facets.applyDeltas(json.loads(self.request.get('deltas')),
+                           self.request.get('changeId'))
+
+
+class RecomputeFacetsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Recompute conference facet counts from scratch."""
+        facets.recompute()
+        self.response.set_status(204)
+
+
+class ArchiveConferencesCronHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start moving the conferences that ended to the archive."""
+        archive.start()
+        self.response.set_status(204)
+
+
+class ArchiveConferencesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Archive one batch of the conferences that ended."""
+        cutoff = datetime.strptime(self.request.get('cutoff'),
+                                   '%Y-%m-%d').date()
+        archive.archiveBatch(cutoff, self.request.get('cursor') or None,
+                             int(self.request.get('phase') or 0))
+
+
+class PruneTombstonesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete the deletion records too old to be synced."""
+        sync.pruneTombstones()
+        self.response.set_status(204)
+
+
+class RebuildAgendaHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild the agenda of a conference after a session change."""
+        agenda.rebuild(
+            ndb.Key(urlsafe=self.request.get('websafeConferenceKey')))
+
+
+class PromoteWaitlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Register waiting users into the seats freed in a conference."""
+        waitlist.promote(self.request.get('websafeConferenceKey'))
+
+
+class IndexTopicsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Update the topic index of a created or updated conference."""
+        conf = ndb.Key(urlsafe=self.request.get('websafeConferenceKey')).get()
+        if conf:
+            recommendations.indexConference(
+                conf, self.request.get_all('oldTopics'))
+
+
+class RecomputeAnalyticsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Recompute conference analytics from scratch."""
+        analytics.recompute()
+        self.response.set_status(204)
+
+
+class DeliverNotificationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Deliver queued notifications in batched digests."""
+        for _ in range(MAX_NOTIFICATION_BATCHES):
+            if notifications.deliverBatch() < notifications.BATCH_SIZE:
+                break
+        self.response.set_status(204)
+
+
+class NotificationMetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return notification delivery metrics as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(notifications.getMetrics()))
+
+
+class RateLimitMetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return rate limiter decisions per endpoint as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(ratemetrics.getMetrics()))
+
+
+class FeedHandler(webapp2.RequestHandler):
+    def _serve(self, feed, cacheControl):
+        """Write an (etag, body) iCalendar feed, or 304 if the client has
+        it already."""
+        if not feed:
+            self.abort(404)
+        tag, body = feed
+        self.response.headers['ETag'] = tag
+        self.response.headers['Cache-Control'] = cacheControl
+        matches = [t.strip() for t in
+                   self.request.headers.get('If-None-Match', '').split(',')]
+        if tag in matches or '*' in matches:
+            self.response.set_status(304)
+            return
+        self.response.headers['Content-Type'] = 'text/calendar; charset=utf-8'
+        self.response.write(body)
+
+
+class ConferenceFeedHandler(FeedHandler):
+    def get(self, websafeConferenceKey):
+        """Return the agenda of a conference as an iCalendar feed."""
+        self._serve(feeds.conferenceFeed(websafeConferenceKey),
+                    'public, max-age=300')
+
+
+class WishlistFeedHandler(FeedHandler):
+    def get(self, token):
+        """Return the wishlist of a user as an iCalendar feed."""
+        self._serve(feeds.wishlistFeed(token), 'private, max-age=300')
+
+
+class QueryCacheMetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return conference query cache hit rates as JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(querycache.getMetrics()))
+
+
+class NameCacheMetricsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the name cache hit ratios & sizes of this instance as
+        JSON."""
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(namecache.getMetrics()))
+
+
+class MapperHandler(webapp2.RequestHandler):
+    def post(self):
+        """Process one batch of a mapper job."""
+        mapper.runBatch(self.request.get('name'),
+                        int(self.request.get('generation')),
+                        int(self.request.get('batch')))
+
+
+class MapperAdminHandler(webapp2.RequestHandler):
+    def get(self):
+        """Return the progress of the mapper jobs as JSON."""
+        jobs = [dict(job.to_dict(exclude=['started', 'lastUpdate']),
+                     started=str(job.started), lastUpdate=str(job.lastUpdate))
+                for job in MapperJob.query()]
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(jobs))
+
+    def post(self):
+        """Start, resume or abort the mapper job of a transform."""
+        name = self.request.get('name')
+        action = self.request.get('action')
+        if action == 'start':
+            mapper.start(name,
+                         int(self.request.get('batchSize') or
+                             mapper.DEFAULT_BATCH_SIZE),
+                         float(self.request.get('delay') or
+                               mapper.DEFAULT_DELAY))
+        elif action == 'resume':
+            mapper.resume(name)
+        elif action == 'abort':
+            mapper.abort(name)
+        else:
+            self.abort(400)
+        self.response.set_status(204)
+
+
+class ProfilesHandler(webapp2.RequestHandler):
+    PAGE = ('<html><head><title>Profiles</title></head><body>'
+            '<h1>%s</h1><table border="1" cellpadding="3">%s</table>'
+            '</body></html>')
+
+    def get(self):
+        """Show the recent request profiles, or the top functions of one."""
+        profileId = self.request.get('id')
+        if profileId:
+            record = ProfileRecord.get_by_id(int(profileId))
+            if not record:
+                self.abort(404)
+            title = '%s (%d ms, %s)' % (record.path, record.duration,
+                                        record.created)
+            rows = ['<tr><th>function</th><th>calls</th><th>total s</th>'
+                    '<th>cumulative s</th></tr>']
+            rows.extend('<tr><td>%s</td><td>%d</td><td>%.4f</td>'
+                        '<td>%.4f</td></tr>' % (cgi.escape(function), calls,
+                                                total, cumulative)
+                        for function, calls, total, cumulative
+                        in record.functions)
+        else:
+            title = 'Recent profiles'
+            rows = ['<tr><th>created</th><th>path</th><th>ms</th></tr>']
+            rows.extend('<tr><td><a href="?id=%d">%s</a></td><td>%s</td>'
+                        '<td>%d</td></tr>' % (summary['id'],
+                                              summary['created'],
+                                              cgi.escape(summary['path']),
+                                              summary['duration'])
+                        for summary in profiling.getRecent())
+        self.response.write(self.PAGE % (cgi.escape(title), ''.join(rows)))
+
+    def post(self):
+        """Arm profiling of the X-Profile requests for some minutes, or
+        disarm it with 0."""
+        minutes = float(self.request.get('minutes') or 0)
+        if minutes > 0:
+            profiling.arm(minutes)
+        else:
+            profiling.disarm()
+        self.response.set_status(204)
+
+
+class PruneProfilesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete the old request profiles."""
+        profiling.pruneRecords()
+        self.response.set_status(204)
 
 
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/deliver_notifications', DeliverNotificationsHandler),
+    ('/admin/notifications', NotificationMetricsHandler),
+    ('/admin/ratelimits', RateLimitMetricsHandler),
+    ('/admin/query_cache', QueryCacheMetricsHandler),
+    ('/admin/name_cache', NameCacheMetricsHandler),
+    ('/admin/profiles', ProfilesHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeaker),
+    ('/tasks/notify_attendees', NotifyAttendeesHandler),
+    ('/tasks/record_analytics', RecordAnalyticsHandler),
+    ('/crons/recompute_analytics', RecomputeAnalyticsHandler),
+    ('/tasks/record_facets', RecordFacetsHandler),
+    ('/tasks/index_topics', IndexTopicsHandler),
+    ('/tasks/rebuild_agenda', RebuildAgendaHandler),
+    ('/tasks/promote_waitlist', PromoteWaitlistHandler),
+    ('/crons/recompute_facets', RecomputeFacetsHandler),
+    ('/crons/prune_tombstones', PruneTombstonesHandler),
+    ('/crons/prune_profiles', PruneProfilesHandler),
+    ('/crons/archive_conferences', ArchiveConferencesCronHandler),
+    ('/tasks/archive_conferences', ArchiveConferencesHandler),
+    ('/tasks/mapper', MapperHandler),
+    (r'/feeds/conference/([^/]+)\.ics', ConferenceFeedHandler),
+    (r'/feeds/wishlist/([^/]+)\.ics', WishlistFeedHandler),
+    ('/admin/mapper', MapperAdminHandler),
 ], debug=True)
+app = profiling.middleware(app)
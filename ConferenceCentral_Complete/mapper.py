@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""mapper.py
+
+Udacity conference server-side Python App Engine datastore mapper
+
+A mapper applies a registered transform to every entity of a kind, for
+schema backfills. Each task processes one fetch_page batch, writes the
+changed entities back and then, in one transaction, checkpoints the
+cursor & progress in a MapperJob and chains the task for the next batch.
+A batch interrupted before its checkpoint is processed again, so
+transforms must be idempotent.
+
+An entity the transform changed is written back in its own short
+transaction, which gets it again & reapplies the transform, so a write
+committed since the batch was fetched (e.g. a registration taking a
+seat) is never overwritten by the stale copy. Throughput is throttled by the batch size,
+the delay between batches and the 'mapper' queue rate (queue.yaml).
+
+"""
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import MapperJob
+
+MAPPER_QUEUE = 'mapper'
+MAPPER_URL = '/tasks/mapper'
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_DELAY = 1.0
+
+# transform name -> (model class, function)
+_transforms = {}
+
+
+def register(name, model, transform):
+    """Register a transform applied to every entity of a model. It returns
+    True if it changed the entity, which is then written back; such
+    transforms are run again in the write transaction, so they must only
+    change the entity."""
+    _transforms[name] = (model, transform)
+
+
+def _enqueue(job, transactional=False, countdown=0):
+    taskqueue.add(url=MAPPER_URL, queue_name=MAPPER_QUEUE,
+                  countdown=countdown, transactional=transactional,
+                  params={'name': job.key.id(),
+                          'generation': job.generation,
+                          'batch': job.batch})
+
+
+@ndb.transactional()
+def start(name, batchSize=DEFAULT_BATCH_SIZE, delay=DEFAULT_DELAY):
+    """Start (or restart from the beginning) the mapper of a transform."""
+    if name not in _transforms:
+        raise ValueError('Unknown transform: %s' % name)
+    key = ndb.Key(MapperJob, name)
+    previous = key.get()
+    job = MapperJob(key=key, transform=name, batchSize=batchSize,
+                    delay=delay,
+                    generation=previous.generation + 1 if previous else 0)
+    job.put()
+    _enqueue(job, transactional=True)
+    return job
+
+
+@ndb.transactional()
+def resume(name):
+    """Enqueue the next batch of a job from its checkpoint, e.g. after it
+    was aborted or its task chain was lost."""
+    job = ndb.Key(MapperJob, name).get()
+    if not job or job.status == 'done':
+        return job
+    job.generation += 1
+    job.status = 'running'
+    job.put()
+    _enqueue(job, transactional=True)
+    return job
+
+
+@ndb.transactional()
+def abort(name):
+    """Stop a job after the batch in progress."""
+    job = ndb.Key(MapperJob, name).get()
+    if job and job.status == 'running':
+        job.status = 'aborted'
+        job.put()
+    return job
+
+
+def runBatch(name, generation, batch, chain=True):
+    """Process one batch of a job & checkpoint it. Return the job, or None
+    if the batch is stale (already processed, or from a previous run)."""
+    job = ndb.Key(MapperJob, name).get()
+    if (not job or job.status != 'running' or job.generation != generation
+            or job.batch != batch):
+        return None
+    model, transform = _transforms[job.transform]
+
+    entities, cursor, more = model.query().fetch_page(
+        job.batchSize, start_cursor=Cursor(urlsafe=job.cursor))
+    changed = [entity.key for entity in entities if transform(entity)]
+    updated = sum(1 for key in changed if _apply(key, transform))
+    return _checkpoint(name, generation, batch, len(entities), updated,
+                       cursor.urlsafe() if more and cursor else None, chain)
+
+
+@ndb.transactional()
+def _apply(key, transform):
+    """Apply a transform to the current version of an entity and write it
+    back if it changed. Return whether it was written."""
+    entity = key.get()
+    if not entity or not transform(entity):
+        return False
+    entity.put()
+    return True
+
+
+@ndb.transactional()
+def _checkpoint(name, generation, batch, processed, updated, cursor, chain):
+    job = ndb.Key(MapperJob, name).get()
+    if job.generation != generation or job.batch != batch:
+        # a concurrent duplicate of this task checkpointed first
+        return None
+    job.batch += 1
+    job.cursor = cursor
+    job.processed += processed
+    job.updated += updated
+    if not cursor:
+        job.status = 'done'
+    job.put()
+    if chain and job.status == 'running':
+        _enqueue(job, transactional=True, countdown=job.delay)
+    return job
+
+
+def runToCompletion(name, batchSize=DEFAULT_BATCH_SIZE):
+    """Run a whole mapper synchronously, without tasks; for tests & local
+    runs against the datastore stub."""
+    if name not in _transforms:
+        raise ValueError('Unknown transform: %s' % name)
+    key = ndb.Key(MapperJob, name)
+    previous = key.get()
+    job = MapperJob(key=key, transform=name, batchSize=batchSize, delay=0,
+                    generation=previous.generation + 1 if previous else 0)
+    job.put()
+    while job and job.status == 'running':
+        job = runBatch(name, job.generation, job.batch, chain=False)
+    return key.get()
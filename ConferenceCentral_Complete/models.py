@@ -2,7 +2,7 @@
 
 """models.py
 
-Udacity conference server-side Python App Engine data & ProtoRPC models
+Udacity conference server-side Python App Engine data models
 
 $Id: models.py,v 1.1 2014/05/24 22:01:10 wesc Exp $
 
@@ -12,14 +12,9 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
-import httplib
-import endpoints
-from protorpc import messages
 from google.appengine.ext import ndb
 
-class ConflictException(endpoints.ServiceException):
-    """ConflictException -- exception mapped to HTTP 409 response"""
-    http_status = httplib.CONFLICT
+import schedule
 
 class Profile(ndb.Model):
     """Profile -- User profile object"""
@@ -28,27 +23,8 @@ class Profile(ndb.Model):
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionsWishlist = ndb.StringProperty(repeated=True)
-
-class ProfileMiniForm(messages.Message):
-    """ProfileMiniForm -- update Profile form message"""
-    displayName = messages.StringField(1)
-    teeShirtSize = messages.EnumField('TeeShirtSize', 2)
-
-class ProfileForm(messages.Message):
-    """ProfileForm -- Profile outbound form message"""
-    displayName = messages.StringField(1)
-    mainEmail = messages.StringField(2)
-    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
-    conferenceKeysToAttend = messages.StringField(4, repeated=True)
-    sessionsWishlist = messages.StringField(5, repeated=True)
-
-class StringMessage(messages.Message):
-    """StringMessage-- outbound (single) string message"""
-    data = messages.StringField(1, required=True)
-
-class BooleanMessage(messages.Message):
-    """BooleanMessage-- outbound Boolean value message"""
-    data = messages.BooleanField(1)
+    # secret token of the wishlist iCalendar feed (feeds.py)
+    feedToken = ndb.StringProperty(indexed=False)
 
 class Conference(ndb.Model):
     """Conference -- Conference object"""
@@ -62,53 +38,20 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
-
-class ConferenceForm(messages.Message):
-    """ConferenceForm -- Conference outbound form message"""
-    name            = messages.StringField(1)
-    description     = messages.StringField(2)
-    organizerUserId = messages.StringField(3)
-    topics          = messages.StringField(4, repeated=True)
-    city            = messages.StringField(5)
-    startDate       = messages.StringField(6) #DateTimeField()
-    month           = messages.IntegerField(7)
-    maxAttendees    = messages.IntegerField(8)
-    seatsAvailable  = messages.IntegerField(9)
-    endDate         = messages.StringField(10) #DateTimeField()
-    websafeKey      = messages.StringField(11)
-    organizerDisplayName = messages.StringField(12)
-
-class ConferenceForms(messages.Message):
-    """ConferenceForms -- multiple Conference outbound form message"""
-    items = messages.MessageField(ConferenceForm, 1, repeated=True)
-
-class TeeShirtSize(messages.Enum):
-    """TeeShirtSize -- t-shirt size enumeration value"""
-    NOT_SPECIFIED = 1
-    XS_M = 2
-    XS_W = 3
-    S_M = 4
-    S_W = 5
-    M_M = 6
-    M_W = 7
-    L_M = 8
-    L_W = 9
-    XL_M = 10
-    XL_W = 11
-    XXL_M = 12
-    XXL_W = 13
-    XXXL_M = 14
-    XXXL_W = 15
-
-class ConferenceQueryForm(messages.Message):
-    """ConferenceQueryForm -- Conference query inbound form message"""
-    field = messages.StringField(1)
-    operator = messages.StringField(2)
-    value = messages.StringField(3)
-
-class ConferenceQueryForms(messages.Message):
-    """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
-    filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    # year-month and ISO week buckets covering startDate..endDate, so that
+    # date range queries only need equality filters (see schedule.py)
+    monthBuckets    = ndb.ComputedProperty(
+        lambda self: schedule.spanBuckets(self, schedule.monthBuckets),
+        repeated=True)
+    weekBuckets     = ndb.ComputedProperty(
+        lambda self: schedule.spanBuckets(self, schedule.weekBuckets),
+        repeated=True)
+    # last write, read by getChangesSince (see sync.py)
+    modified        = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        Tombstone.record(key)
 
 class Session(ndb.Model):
     """Session -- Session object"""
@@ -127,47 +70,71 @@ class Session(ndb.Model):
     date          = ndb.DateProperty()
     # starting time of the session
     startTime     = ndb.TimeProperty()
+    # start time and duration buckets, so that time range queries only
+    # need equality filters (see schedule.py)
+    startBlocks   = ndb.ComputedProperty(
+        lambda self: schedule.startBlocks(self.startTime)
+        if self.startTime is not None else [], repeated=True)
+    durationLimits = ndb.ComputedProperty(
+        lambda self: schedule.durationLimits(self.duration), repeated=True)
+    # last write, read by getChangesSince (see sync.py)
+    modified      = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        Tombstone.record(key)
+
     # equality definition for sessions (used to compute the intersection of two session lists)
     def __eq__(self, other):
         return self.name == other.name
 
+class Agenda(ndb.Model):
+    """Agenda -- snapshot of the sessions of a conference, child of it"""
 
-class SessionMiniForm(messages.Message):
-    """SessionMiniForm -- message for creating sessions"""
-
-    name          = messages.StringField(1)
-    highlights    = messages.StringField(2, repeated=True)
-    # the form stores the complete speaker information, instead of just the id
-    speakerName   = messages.StringField(3)
-    speakerEmail  = messages.StringField(4)
-    duration      = messages.IntegerField(5)
-    typeOfSession = messages.StringField(6)
-    date          = messages.StringField(7)
-    startTime     = messages.StringField(8)
+    # SessionForm fields of every session, by date & start time (agenda.py)
+    sessions = ndb.JsonProperty(compressed=True)
 
+class ArchivedConference(ndb.Model):
+    """ArchivedConference -- Conference moved to the archive (archive.py),
+    with the parent & id of the original; only the fields archive searches
+    filter on are indexed"""
 
-class SessionForm(messages.Message):
-    """SessionForm -- Session outbound form message"""
-
-    name          = messages.StringField(1)
-    highlights    = messages.StringField(2, repeated=True)
-    # the form stores the complete speaker information, instead of just the id
-    speakerName   = messages.StringField(3)
-    speakerEmail  = messages.StringField(4)
-    duration      = messages.IntegerField(5)
-    typeOfSession = messages.StringField(6)
-    date          = messages.StringField(7)
-    startTime     = messages.StringField(8)
-    # key of the conference hosting this session
-    websafeConferenceKey = messages.StringField(9)
-    # key of the session itself
-    websafeSessionKey = messages.StringField(10)
-
-class SessionForms(messages.Message):
-    """SessionForms -- multiple Session outbound form message"""
-
-    # store a list of session forms
-    items = messages.MessageField(SessionForm, 1, repeated=True)
+    name            = ndb.StringProperty(indexed=False)
+    description     = ndb.StringProperty(indexed=False)
+    organizerUserId = ndb.StringProperty(indexed=False)
+    topics          = ndb.StringProperty(repeated=True)
+    city            = ndb.StringProperty()
+    startDate       = ndb.DateProperty(indexed=False)
+    month           = ndb.IntegerProperty()
+    endDate         = ndb.DateProperty(indexed=False)
+    maxAttendees    = ndb.IntegerProperty(indexed=False)
+    seatsAvailable  = ndb.IntegerProperty(indexed=False)
+    monthBuckets    = ndb.StringProperty(repeated=True)
+    # time the conference was archived
+    archived        = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+class ArchivedSession(ndb.Model):
+    """ArchivedSession -- Session moved to the archive, child of its
+    ArchivedConference; read by ancestor only, so nothing is indexed"""
+
+    name          = ndb.StringProperty(indexed=False)
+    highlights    = ndb.StringProperty(repeated=True, indexed=False)
+    speakerId     = ndb.StringProperty(indexed=False)
+    duration      = ndb.IntegerProperty(indexed=False)
+    typeOfSession = ndb.StringProperty(indexed=False)
+    date          = ndb.DateProperty(indexed=False)
+    startTime     = ndb.TimeProperty(indexed=False)
+
+class Tombstone(ndb.Model):
+    """Tombstone -- deletion record of a Conference or Session, child of
+    its key, so it is written in the transaction deleting it"""
+
+    # time of the deletion, read by getChangesSince (see sync.py)
+    deleted = ndb.DateTimeProperty(auto_now=True)
+
+    @classmethod
+    def record(cls, key):
+        cls(parent=key, id=1).put()
 
 class Speaker(ndb.Model):
     """Speaker -- Speaker object"""
@@ -176,10 +143,72 @@ class Speaker(ndb.Model):
     name  = ndb.StringProperty(required=True)
     # email of the speaker. Uniquely identifies the speaker
     email = ndb.StringProperty(required=True)
-
-class SpeakerForm(messages.Message):
-    """SpeakerForm -- Speaker outbound form message"""
-
-    # fields resemble those of kind Speaker
-    name  = messages.StringField(1)
-    email = messages.StringField(2)
+    # lowercase name, used for name prefix lookups in the speaker directory
+    nameLower = ndb.ComputedProperty(lambda self: self.name.lower())
+    # aggregates maintained on session creation: number of sessions, keys
+    # of the conferences the speaker takes part in and session keys
+    sessionCount   = ndb.IntegerProperty(default=0)
+    conferenceKeys = ndb.StringProperty(repeated=True)
+    sessionKeys    = ndb.StringProperty(repeated=True, indexed=False)
+
+class AnalyticsShard(ndb.Model):
+    """AnalyticsShard -- one shard of the conference analytics aggregates"""
+
+    # {dimension: {value: {counter: total}}}, see analytics.py
+    stats = ndb.JsonProperty()
+    # ids of the last changes added, oldest first
+    applied = ndb.StringProperty(repeated=True, indexed=False)
+
+class WaitlistShard(ndb.Model):
+    """WaitlistShard -- root of one shard of a conference waitlist; its id
+    is '<websafeConferenceKey>:<shard>' and it is never stored"""
+
+class WaitlistEntry(ndb.Model):
+    """WaitlistEntry -- user waiting for a seat; id is the user id"""
+
+    # entries are promoted in the order they joined (waitlist.py)
+    joined = ndb.DateTimeProperty(auto_now_add=True)
+
+class TopicIndex(ndb.Model):
+    """TopicIndex -- one shard of the upcoming conferences about one topic;
+    id is 'topic:shard'"""
+
+    # {websafeConferenceKey: {'city': ..., 'startDate': ...}}, see
+    # recommendations.py
+    entries = ndb.JsonProperty()
+
+class FacetCounts(ndb.Model):
+    """FacetCounts -- one shard of the facet counts of one cell"""
+
+    # {field: {value: count}}, see facets.py
+    counts = ndb.JsonProperty()
+
+class ProfileRecord(ndb.Model):
+    """ProfileRecord -- top functions of one profiled request (profiling.py)"""
+
+    path     = ndb.StringProperty(indexed=False)
+    created  = ndb.DateTimeProperty(auto_now_add=True)
+    # milliseconds spent in the request
+    duration = ndb.IntegerProperty(indexed=False)
+    # [function, calls, total seconds, cumulative seconds] by cumulative time
+    functions = ndb.JsonProperty(compressed=True)
+
+class MapperJob(ndb.Model):
+    """MapperJob -- checkpoint of a mapper run over one kind (mapper.py)"""
+
+    # name of the registered transform; also the id of the job
+    transform   = ndb.StringProperty(required=True)
+    batchSize   = ndb.IntegerProperty(indexed=False)
+    # seconds to wait between batches
+    delay       = ndb.FloatProperty(indexed=False)
+    # bumped on every (re)start, so tasks of a previous run are ignored
+    generation  = ndb.IntegerProperty(default=0, indexed=False)
+    # next batch to process and the cursor it starts from
+    batch       = ndb.IntegerProperty(default=0, indexed=False)
+    cursor      = ndb.StringProperty(indexed=False)
+    processed   = ndb.IntegerProperty(default=0, indexed=False)
+    updated     = ndb.IntegerProperty(default=0, indexed=False)
+    # 'running', 'done' or 'aborted'
+    status      = ndb.StringProperty(default='running')
+    started     = ndb.DateTimeProperty(auto_now_add=True)
+    lastUpdate  = ndb.DateTimeProperty(auto_now=True)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+"""namecache.py
+
+Udacity conference server-side Python App Engine speaker & organizer name
+cache
+
+Forms carry the name of the speaker of every session and the display name
+of the organizer of every conference. Those few thousand small values are
+kept in a size-bounded LRU cache inside the instance, shared by the
+concurrent requests it serves, in front of memcache and the datastore.
+Entries expire after a TTL, which bounds how long another instance may
+serve a name changed through this one; the instance making the change
+drops its entry and the memcache copy right away.
+
+"""
+
+import collections
+import sys
+import threading
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import Speaker
+
+MEMCACHE_ORGANIZER_PREFIX = "ORGANIZER_NAME_"
+MEMCACHE_SPEAKER_PREFIX = "SPEAKER_NAME_"
+# entries kept per instance at most & their lifetime in seconds
+MAX_ENTRIES = 5000
+TTL_SECONDS = 60
+MEMCACHE_SECONDS = 3600
+
+# what a session form shows of its speaker
+SpeakerName = collections.namedtuple('SpeakerName', ['name', 'email'])
+
+
+class LruCache(object):
+    """LruCache -- thread-safe, size-bounded LRU cache with expiring
+    entries
+
+    Entries are kept in an OrderedDict from the least to the most recently
+    used; a hit moves its entry to the end, a put past maxEntries evicts
+    from the front.
+    """
+
+    def __init__(self, maxEntries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        # key -> (value, expiration time, size in bytes)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _drop(self, key):
+        value, expires, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def getMulti(self, keys):
+        """Return {key: value} of the keys cached & not expired."""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    self._drop(key)
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                # move to the most recently used end
+                del self._entries[key]
+                self._entries[key] = entry
+                found[key] = entry[0]
+        return found
+
+    def putMulti(self, values):
+        """Cache the values of a {key: value} dict."""
+        expires = time.time() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                if key in self._entries:
+                    self._drop(key)
+                size = _sizeOf(key) + _sizeOf(value)
+                self._entries[key] = (value, expires, size)
+                self._bytes += size
+            while len(self._entries) > self.maxEntries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def getMetrics(self):
+        """Return the hits, misses, hit ratio & size of the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hitRatio': float(self.hits) / total if total else 0.0,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+
+def _sizeOf(value):
+    """Return the approximate memory size of a key or value."""
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_sizeOf(item) for item in value)
+    return sys.getsizeof(value)
+
+
+_organizers = LruCache()
+_speakers = LruCache()
+
+
+def _lookup(cache, prefix, ids, load):
+    """Return {id: value} of the ids found in the instance cache, then in
+    memcache, then loaded from the datastore by load(missing ids)."""
+    ids = set(i for i in ids if i)
+    found = cache.getMulti(ids)
+    missing = ids - set(found)
+    if missing:
+        cached = memcache.get_multi(list(missing), key_prefix=prefix)
+        found.update(cached)
+        loaded = load([i for i in missing if i not in cached])
+        if loaded:
+            memcache.set_multi(loaded, key_prefix=prefix,
+                               time=MEMCACHE_SECONDS)
+        found.update(loaded)
+        cache.putMulti(dict((i, found[i]) for i in missing if i in found))
+    return found
+
+
+def _loadOrganizers(userIds):
+    profiles = ndb.get_multi([ndb.Key(Profile, i) for i in userIds])
+    return dict((prof.key.id(), prof.displayName)
+                for prof in profiles if prof)
+
+
+def _loadSpeakers(speakerIds):
+    speakers = ndb.get_multi([ndb.Key(Speaker, i) for i in speakerIds])
+    return dict((speaker.key.id(), SpeakerName(speaker.name, speaker.email))
+                for speaker in speakers if speaker)
+
+
+def getOrganizerNames(userIds):
+    """Return {user id: display name} of the organizers with a profile."""
+    return _lookup(_organizers, MEMCACHE_ORGANIZER_PREFIX, userIds,
+                   _loadOrganizers)
+
+
+def getOrganizerName(userId):
+    """Return the display name of an organizer, or None."""
+    return getOrganizerNames([userId]).get(userId)
+
+
+def getSpeakers(speakerIds):
+    """Return {speaker id: SpeakerName} of the existing speakers."""
+    return _lookup(_speakers, MEMCACHE_SPEAKER_PREFIX, speakerIds,
+                   _loadSpeakers)
+
+
+def getSpeaker(speakerId):
+    """Return the SpeakerName of a speaker, or None."""
+    return getSpeakers([speakerId]).get(speakerId)
+
+
+def invalidateOrganizer(userId):
+    """Drop the cached display name of an organizer."""
+    _organizers.delete(userId)
+    memcache.delete(MEMCACHE_ORGANIZER_PREFIX + userId)
+
+
+def invalidateSpeaker(speakerId):
+    """Drop the cached name of a speaker."""
+    _speakers.delete(speakerId)
+    memcache.delete(MEMCACHE_SPEAKER_PREFIX + speakerId)
+
+
+def getMetrics():
+    """Return the metrics of the caches of this instance."""
+    return {'organizers': _organizers.getMetrics(),
+            'speakers': _speakers.getMetrics()}
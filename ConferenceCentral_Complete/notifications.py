@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""notifications.py
+
+Udacity conference server-side Python App Engine batched notifications
+
+Notifications are written as compact records to the 'notifications' pull
+queue. A worker run from cron leases them in batches, groups them by
+recipient into one digest email each and sends the digests with bounded
+concurrency. Records of digests that could not be sent are left in the
+queue, so they are leased again once their lease expires.
+
+Changes to a conference are fanned out to its attendees by a chain of
+push tasks, each paging over one fixed-size batch of attendees.
+
+"""
+
+import json
+import logging
+import threading
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Profile
+
+NOTIFICATION_QUEUE = 'notifications'
+LEASE_SECONDS = 60
+BATCH_SIZE = 100
+MAX_CONCURRENT_SENDS = 10
+# attendees notified by each task of a fan-out chain
+ATTENDEE_BATCH_SIZE = 100
+
+MEMCACHE_METRICS_PREFIX = "NOTIFICATION_METRICS_"
+METRICS = ('enqueued', 'leased', 'sent', 'digests', 'failures')
+
+# subject & body of every kind of notification, filled with its data
+TEMPLATES = {
+    'conferenceCreated': (
+        'You created a new Conference!',
+        'Hi, you have created the following conference:\r\n\r\n'
+        '%(name)s (%(city)s, %(startDate)s - %(endDate)s)'),
+    'conferenceChanged': (
+        'A conference you attend has changed',
+        'Hi, the following conference you are registered for has changed:'
+        '\r\n\r\n%(name)s\r\n%(changes)s'),
+    'waitlistPromoted': (
+        'You are registered for a conference',
+        'Hi, a seat freed up and you have been registered from the waitlist '
+        'for the following conference:\r\n\r\n%(name)s'),
+}
+DIGEST_SUBJECT = 'You have %d new notifications'
+
+
+class AppEngineMailer(object):
+    """AppEngineMailer -- sends email through the App Engine mail API"""
+
+    def send(self, sender, to, subject, body):
+        mail.send_mail(sender, to, subject, body)
+
+
+class MailStub(object):
+    """MailStub -- keeps sent email in memory instead of sending it; for
+    tests & local runs (see useMailer)"""
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def send(self, sender, to, subject, body):
+        with self._lock:
+            self.messages.append(
+                {'sender': sender, 'to': to, 'subject': subject,
+                 'body': body})
+
+
+mailer = AppEngineMailer()
+
+
+def useMailer(newMailer):
+    """Replace the mailer used to send digests, returning the previous."""
+    global mailer
+    previous, mailer = mailer, newMailer
+    return previous
+
+
+def _countMetrics(**counts):
+    memcache.offset_multi(counts, key_prefix=MEMCACHE_METRICS_PREFIX,
+                          initial_value=0)
+
+
+def getMetrics():
+    """Return delivery counters & the number of notifications queued."""
+    metrics = dict((name, 0) for name in METRICS)
+    metrics.update(memcache.get_multi(list(METRICS),
+                                      key_prefix=MEMCACHE_METRICS_PREFIX))
+    stats = taskqueue.Queue(NOTIFICATION_QUEUE).fetch_statistics()
+    metrics['queued'] = stats.tasks
+    return metrics
+
+
+def enqueue(to, kind, **data):
+    """Write a notification of the given kind for a recipient."""
+    enqueueMulti([(to, kind, data)])
+
+
+def enqueueMulti(notifications, names=None):
+    """Write several (to, kind, data) notifications with one queue call.
+    Named notifications already written are skipped."""
+    tasks = []
+    for i, (to, kind, data) in enumerate(notifications):
+        if kind not in TEMPLATES:
+            raise ValueError('Unknown notification kind: %s' % kind)
+        payload = json.dumps({'to': to, 'kind': kind, 'data': data})
+        tasks.append(taskqueue.Task(payload=payload, method='PULL',
+                                    name=names[i] if names else None))
+    if not tasks:
+        return
+    try:
+        taskqueue.Queue(NOTIFICATION_QUEUE).add(tasks)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        # a retried fan-out task; the other notifications were written
+        pass
+    _countMetrics(enqueued=len(tasks))
+
+
+def notifyAttendees(websafeConferenceKey, changeId, data, batch=0,
+                    cursor=None):
+    """Notify one batch of the attendees of a conference of a change, then
+    chain the task notifying the next batch.
+
+    Notifications & chained tasks are named after the change & batch, so
+    a retried task does not notify anybody twice.
+    """
+    p_keys, nextCursor, more = Profile.query(
+        Profile.conferenceKeysToAttend == websafeConferenceKey).fetch_page(
+        ATTENDEE_BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor),
+        keys_only=True)
+    profiles = [prof for prof in ndb.get_multi(p_keys)
+                if prof and prof.mainEmail]
+    enqueueMulti(
+        [(prof.mainEmail, 'conferenceChanged', data) for prof in profiles],
+        names=['%s-%d-%d' % (changeId, batch, i)
+               for i in range(len(profiles))])
+
+    if more and nextCursor:
+        try:
+            taskqueue.add(url='/tasks/notify_attendees',
+                          name='attendees-%s-%d' % (changeId, batch + 1),
+                          params={'websafeConferenceKey': websafeConferenceKey,
+                                  'changeId': changeId,
+                                  'data': json.dumps(data),
+                                  'batch': batch + 1,
+                                  'cursor': nextCursor.urlsafe()})
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+
+def render(kind, data):
+    """Return the (subject, body) of a notification."""
+    subject, body = TEMPLATES[kind]
+    return subject, body % data
+
+
+def digest(notifications):
+    """Return the (subject, body) of the digest of some notifications."""
+    rendered = [render(n['kind'], n['data']) for n in notifications]
+    if len(rendered) == 1:
+        return rendered[0]
+    return (DIGEST_SUBJECT % len(rendered),
+            '\r\n\r\n'.join('%s\r\n%s' % message for message in rendered))
+
+
+def _sendDigests(digests, maxConcurrent):
+    """Send {recipient: (subject, body)} digests, at most maxConcurrent at
+    a time. Return the recipients that were sent their digest."""
+    sender = 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+    pending = list(digests.items())
+    sent = []
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                to, (subject, body) = pending.pop()
+            try:
+                mailer.send(sender, to, subject, body)
+            except Exception:
+                logging.exception('Failed to send notifications to %s', to)
+            else:
+                with lock:
+                    sent.append(to)
+
+    workers = [threading.Thread(target=work)
+               for _ in range(min(maxConcurrent, len(pending)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sent
+
+
+def deliverBatch(batchSize=BATCH_SIZE, maxConcurrent=MAX_CONCURRENT_SENDS):
+    """Lease a batch of notifications & send one digest per recipient.
+    Return the number of notifications leased."""
+    queue = taskqueue.Queue(NOTIFICATION_QUEUE)
+    tasks = queue.lease_tasks(LEASE_SECONDS, batchSize)
+    if not tasks:
+        return 0
+
+    # group notifications by recipient
+    byRecipient = {}
+    for task in tasks:
+        notification = json.loads(task.payload)
+        byRecipient.setdefault(notification['to'], []).append(
+            (task, notification))
+
+    digests = dict(
+        (to, digest([notification for task, notification in items]))
+        for to, items in byRecipient.items())
+    sent = _sendDigests(digests, maxConcurrent)
+
+    # notifications of failed digests stay queued until their lease expires
+    done = [task for to in sent for task, notification in byRecipient[to]]
+    if done:
+        queue.delete_tasks(done)
+    _countMetrics(leased=len(tasks), sent=len(done), digests=len(sent),
+                  failures=len(byRecipient) - len(sent))
+    return len(tasks)
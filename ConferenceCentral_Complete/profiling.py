@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""profiling.py
+
+Udacity conference server-side Python App Engine on-demand CPU profiling
+
+WSGI middleware wrapping the API server and the task & cron handlers.
+A request carrying the X-Profile header is profiled with cProfile when
+it is made by an admin, or while an admin has armed profiling from
+/admin/profiles (API calls reach the app through the Endpoints proxy,
+without the admin session); requests are also picked at random by
+settings.PROFILING_SAMPLE_RATE. The whole request is profiled, ProtoRPC
+decoding & encoding included, and its top functions are stored in a
+ProfileRecord. The summaries of the recent ones are kept in memcache
+for /admin/profiles; a daily cron deletes the records older than
+RETENTION_DAYS.
+
+"""
+
+import cProfile
+from datetime import datetime
+from datetime import timedelta
+import logging
+import pstats
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import users
+from google.appengine.ext import ndb
+
+from models import ProfileRecord
+from settings import PROFILING_SAMPLE_RATE
+
+HEADER = 'HTTP_X_PROFILE'
+MEMCACHE_ARMED_KEY = "PROFILING_ARMED"
+MEMCACHE_RECENT_KEY = "PROFILING_RECENT"
+# functions kept per profile, by cumulative time
+TOP_FUNCTIONS = 40
+# summaries of the latest profiles kept in memcache
+RECENT_PROFILES = 50
+CAS_RETRIES = 3
+RETENTION_DAYS = 7
+PRUNE_BATCH_SIZE = 500
+
+
+def arm(minutes):
+    """Profile the requests carrying the X-Profile header for some
+    minutes, whoever makes them."""
+    memcache.set(MEMCACHE_ARMED_KEY, True, time=int(minutes * 60))
+
+
+def disarm():
+    """Stop profiling the X-Profile requests of non admins."""
+    memcache.delete(MEMCACHE_ARMED_KEY)
+
+
+def _shouldProfile(environ):
+    if HEADER in environ:
+        return (users.is_current_user_admin() or
+                memcache.get(MEMCACHE_ARMED_KEY) is not None)
+    return PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE
+
+
+def topFunctions(profiler, limit=TOP_FUNCTIONS):
+    """Return the functions of a profile taking the most cumulative time,
+    as [function, calls, total seconds, cumulative seconds] lists."""
+    stats = pstats.Stats(profiler).stats
+    rows = [['%s:%d(%s)' % function, calls, total, cumulative]
+            for function, (primitive, calls, total, cumulative, callers)
+            in stats.items()]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:limit]
+
+
+def _summary(record):
+    return {'id': record.key.id(), 'path': record.path,
+            'duration': record.duration, 'created': str(record.created)}
+
+
+def _remember(record):
+    """Put the summary of a record first in the memcache list of the
+    recent ones."""
+    cache = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        recent = cache.gets(MEMCACHE_RECENT_KEY)
+        if recent is None:
+            # getRecent rebuilds the list from the datastore
+            return
+        recent = [_summary(record)] + recent[:RECENT_PROFILES - 1]
+        if cache.cas(MEMCACHE_RECENT_KEY, recent):
+            return
+    cache.delete(MEMCACHE_RECENT_KEY)
+
+
+def _save(path, duration, profiler):
+    try:
+        record = ProfileRecord(path=path, duration=duration,
+                               functions=topFunctions(profiler))
+        record.put()
+        _remember(record)
+    except Exception:
+        logging.exception('Failed to save the profile of %s', path)
+
+
+def getRecent():
+    """Return the summaries (id, path, duration & created) of the latest
+    profiles, newest first."""
+    recent = memcache.get(MEMCACHE_RECENT_KEY)
+    if recent is None:
+        recent = [_summary(record) for record in ProfileRecord.query().order(
+            -ProfileRecord.created).fetch(RECENT_PROFILES)]
+        memcache.add(MEMCACHE_RECENT_KEY, recent)
+    return recent
+
+
+def pruneRecords():
+    """Delete the profile records older than RETENTION_DAYS."""
+    horizon = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+    query = ProfileRecord.query(ProfileRecord.created < horizon)
+    cursor, more = None, True
+    while more:
+        keys, cursor, more = query.fetch_page(
+            PRUNE_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        ndb.delete_multi(keys)
+    memcache.delete(MEMCACHE_RECENT_KEY)
+
+
+def middleware(app):
+    """Wrap a WSGI app so requests asking for it are profiled."""
+    def profiled(environ, start_response):
+        if not _shouldProfile(environ):
+            return app(environ, start_response)
+
+        def run():
+            # consume the response, so encoding it is profiled too
+            result = app(environ, start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        profiler = cProfile.Profile()
+        start = time.time()
+        body = profiler.runcall(run)
+        _save(environ.get('PATH_INFO', ''),
+              int((time.time() - start) * 1000), profiler)
+        return body
+    return profiled
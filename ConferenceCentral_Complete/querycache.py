@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""querycache.py
+
+Udacity conference server-side Python App Engine conference query cache
+
+The keys of the conferences matching a queryConferences filter list are
+cached in memcache under the canonical form of the filters and the
+generations of what the query depends on: a global generation, bumped
+when conferences are created, and one per field filtered or sorted on,
+bumped when a conference update changes it.
+Only keys are cached, so seat changes don't invalidate anything: the
+conferences themselves are read fresh with a get_multi.
+
+queryConferences returns every match, without paging, so the whole key
+list of a query is fetched on a miss and cached, split in chunks of
+CHUNK_SIZE keys to stay under the memcache value size limit. A hit reads
+the count & first chunk, then the other chunks, with one get_multi each;
+a missing chunk is a miss.
+
+"""
+
+import hashlib
+import json
+
+from google.appengine.api import memcache
+
+from etags import bumpVersionOnCommit
+from etags import getVersions
+
+MEMCACHE_QUERY_PREFIX = "CONFERENCE_QUERY_"
+MEMCACHE_METRICS_PREFIX = "CONFERENCE_QUERY_METRICS_"
+GENERATION_KEY = "CONFERENCE_QUERY_GENERATION_%s"
+GLOBAL = 'all'
+# Conference fields queries filter or sort on
+FIELDS = ('city', 'topics', 'month', 'maxAttendees', 'name', 'startDate',
+          'endDate')
+# filter fields that are not Conference fields, mapped to those they read
+DERIVED_FIELDS = {'dates': ('startDate', 'endDate')}
+INTEGER_FIELDS = ('month', 'maxAttendees')
+CHUNK_SIZE = 500
+CACHE_SECONDS = 3600
+
+
+def canonical(filters):
+    """Return the filters formatted by _formatFilters with typed values,
+    in a canonical order."""
+    typed = []
+    for filtr in filters:
+        value = filtr['value']
+        if filtr['field'] in INTEGER_FIELDS:
+            value = int(value)
+        typed.append((filtr['field'], filtr['operator'], value))
+    return sorted(typed)
+
+
+def _cacheKey(filters):
+    """Return the cache key of some filters at the current generations."""
+    filtered = set()
+    for filtr in filters:
+        filtered.update(DERIVED_FIELDS.get(filtr[0], (filtr[0],)))
+    fields = [GLOBAL, 'name'] + sorted(filtered - {'name'})
+    generations = getVersions([GENERATION_KEY % field for field in fields])
+    digest = hashlib.md5(json.dumps([filters, generations])).hexdigest()
+    return MEMCACHE_QUERY_PREFIX + digest
+
+
+def _countMetrics(**counts):
+    memcache.offset_multi(counts, key_prefix=MEMCACHE_METRICS_PREFIX,
+                          initial_value=0)
+
+
+def get(filters):
+    """Return the cached websafe keys matching canonical filters and the
+    cache key to put them under if they are not cached (keys None)."""
+    cacheKey = _cacheKey(filters)
+    cached = memcache.get_multi(['', '0'], key_prefix=cacheKey + ':')
+    count = cached.get('')
+    if count is None:
+        _countMetrics(misses=1)
+        return None, cacheKey
+    chunks = (count + CHUNK_SIZE - 1) // CHUNK_SIZE
+    if chunks > 1:
+        cached.update(memcache.get_multi([str(chunk) for chunk in
+                                          range(1, chunks)],
+                                         key_prefix=cacheKey + ':'))
+    if any(str(chunk) not in cached for chunk in range(chunks)):
+        # a chunk was evicted
+        _countMetrics(misses=1)
+        return None, cacheKey
+    _countMetrics(hits=1)
+    return ([wsck for chunk in range(chunks) for wsck in cached[str(chunk)]],
+            cacheKey)
+
+
+def put(cacheKey, keys):
+    """Cache the whole list of websafe keys of a query under the cache key
+    returned by get()."""
+    chunks = dict((str(i // CHUNK_SIZE), keys[i:i + CHUNK_SIZE])
+                  for i in range(0, len(keys), CHUNK_SIZE))
+    chunks[''] = len(keys)
+    memcache.set_multi(chunks, key_prefix=cacheKey + ':', time=CACHE_SECONDS)
+
+
+def invalidate(fields=(GLOBAL,)):
+    """Drop the cached queries depending on some fields, once the current
+    transaction commits."""
+    for field in fields:
+        bumpVersionOnCommit(GENERATION_KEY % field)
+
+
+def getMetrics():
+    """Return the cache hits & misses and the hit rate."""
+    metrics = {'hits': 0, 'misses': 0}
+    metrics.update(memcache.get_multi(['hits', 'misses'],
+                                      key_prefix=MEMCACHE_METRICS_PREFIX))
+    total = metrics['hits'] + metrics['misses']
+    metrics['hitRate'] = float(metrics['hits']) / total if total else 0.0
+    return metrics
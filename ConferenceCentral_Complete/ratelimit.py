@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""ratelimit.py
+
+Udacity conference server-side Python App Engine per-user rate limiting
+
+Each user (or anonymous client address) has a token bucket per endpoint.
+A bucket holds up to 'burst' tokens and is refilled continuously with
+'rate' tokens per second. Buckets are kept in memcache as (tokens, time)
+and updated with compare-and-set, so all instances share them; a bucket
+expires once it would be full again. When memcache is not available, or
+CAS_RETRIES concurrent updates in a row fail, a bucket kept in the
+instance is used instead. Requests finding the bucket empty fail with
+HTTP 429.
+
+"""
+
+import functools
+import threading
+import time
+
+import endpoints
+from google.appengine.api import memcache
+
+from forms import TooManyRequestsException
+from settings import RATE_LIMITS
+from utils import getUserId
+import ratemetrics
+
+MEMCACHE_BUCKET_PREFIX = "RATELIMIT_"
+
+# compare-and-set attempts on a shared bucket
+CAS_RETRIES = 3
+
+# in-instance buckets kept at most; they are all dropped past this
+MAX_LOCAL_BUCKETS = 10000
+
+# (endpoint, client) -> (tokens, last refill time) of the in-instance buckets
+_localBuckets = {}
+_localLock = threading.Lock()
+
+
+def _clientId(service):
+    """Return the id of the calling user, or the address of anonymous
+    clients, or None if it is not known.
+
+    API calls reach the app through the Endpoints proxy, so REMOTE_ADDR is
+    the address of the proxy; the client address is the one of the
+    request state.
+    """
+    user = endpoints.get_current_user()
+    if user:
+        return 'user:%s' % getUserId(user)
+    address = getattr(service.request_state, 'remote_address', None)
+    return 'ip:%s' % address if address else None
+
+
+def _refill(tokens, last, now, rate, burst):
+    return min(burst, tokens + (now - last) * rate)
+
+
+def _takeShared(endpoint, client, rate, burst):
+    """Take a token from the memcache bucket. Return whether one was
+    left, or None if memcache is not available or too contended."""
+    key = '%s%s:%s' % (MEMCACHE_BUCKET_PREFIX, endpoint, client)
+    # a missing bucket is a full one
+    ttl = int(float(burst) / rate) + 1
+    # cas ids are kept per Client; one per call keeps threads apart
+    cache = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        bucket = cache.gets(key)
+        now = time.time()
+        if bucket is None:
+            if cache.add(key, (burst - 1, now), time=ttl):
+                return True
+            continue
+        tokens = _refill(bucket[0], bucket[1], now, rate, burst)
+        if tokens < 1:
+            # refilling is linear, so the stored bucket stays valid
+            return False
+        if cache.cas(key, (tokens - 1, now), time=ttl):
+            return True
+    return None
+
+
+def _takeLocal(endpoint, client, rate, burst):
+    """Take a token from the bucket of this instance."""
+    now = time.time()
+    with _localLock:
+        if len(_localBuckets) >= MAX_LOCAL_BUCKETS:
+            _localBuckets.clear()
+        tokens, last = _localBuckets.get((endpoint, client), (burst, now))
+        tokens = _refill(tokens, last, now, rate, burst)
+        allowed = tokens >= 1
+        _localBuckets[(endpoint, client)] = (
+            tokens - 1 if allowed else tokens, now)
+    return allowed
+
+
+def take(endpoint, client, rate, burst):
+    """Take a token from the bucket of a client for an endpoint. Return
+    whether the request is allowed."""
+    allowed = _takeShared(endpoint, client, rate, burst)
+    fallback = allowed is None
+    if fallback:
+        allowed = _takeLocal(endpoint, client, rate, burst)
+    ratemetrics.count(endpoint, 'allowed' if allowed else 'throttled',
+                      fallback)
+    return allowed
+
+
+def limited(method):
+    """Decorate an API method so each client may call it at the rate &
+    burst set for the method name in RATE_LIMITS (settings.py). Anonymous
+    callers without a known address are not limited, rather than sharing
+    a single bucket."""
+    endpoint = method.__name__
+    rate, burst = RATE_LIMITS[endpoint]
+
+    @functools.wraps(method)
+    def wrapper(self, request):
+        client = _clientId(self)
+        if client and not take(endpoint, client, rate, burst):
+            raise TooManyRequestsException(
+                'Too many requests, please retry later.')
+        return method(self, request)
+    return wrapper
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""ratemetrics.py
+
+Udacity conference server-side Python App Engine rate limit metrics
+
+The decisions of the limiter (ratelimit.py) are counted per endpoint in
+memcache. They are kept apart from the limiter, which needs Cloud
+Endpoints, so the admin handler of main.py reads them without it.
+
+"""
+
+from google.appengine.api import memcache
+
+from settings import RATE_LIMITS
+
+MEMCACHE_METRICS_PREFIX = "RATELIMIT_METRICS_"
+# limiter decisions counted per endpoint
+DECISIONS = ('allowed', 'throttled', 'fallback')
+
+
+def count(endpoint, decision, fallback):
+    """Count a limiter decision, and whether the fallback bucket made it."""
+    counts = {'%s:%s' % (endpoint, decision): 1}
+    if fallback:
+        counts['%s:fallback' % endpoint] = 1
+    memcache.offset_multi(counts, key_prefix=MEMCACHE_METRICS_PREFIX,
+                          initial_value=0)
+
+
+def getMetrics():
+    """Return the limiter decisions counted for the limited endpoints."""
+    keys = ['%s:%s' % (endpoint, decision) for endpoint in RATE_LIMITS
+            for decision in DECISIONS]
+    counts = memcache.get_multi(keys, key_prefix=MEMCACHE_METRICS_PREFIX)
+    return dict((endpoint, dict(
+        (decision, counts.get('%s:%s' % (endpoint, decision), 0))
+        for decision in DECISIONS)) for endpoint in RATE_LIMITS)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""recommendations.py
+
+Udacity conference server-side Python App Engine conference recommendations
+
+An inverted index maps every topic to the upcoming conferences about it,
+with the city & start date of each. The index of a topic is split into
+NUM_SHARDS TopicIndex entities, a conference going to the shard picked by
+a hash of its key, so concurrent updates of a popular topic rarely contend
+for the same entity group. It is updated in a task when a conference is
+created or updated and read through memcache, so recommending conferences
+to a user reads the cached shards of the topics of the conferences the
+user attends and scores the candidates without loading them.
+
+A shard keeps the MAX_SHARD_ENTRIES conferences starting first. The
+default topics of conferences created without any are not indexed.
+
+"""
+
+from datetime import date
+import hashlib
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import TopicIndex
+
+MEMCACHE_TOPIC_INDEX_PREFIX = "TOPIC_INDEX_"
+NUM_SHARDS = 8
+MAX_SHARD_ENTRIES = 500
+# the topics conference.py gives conferences created without any
+IGNORED_TOPICS = frozenset(["Default", "Topic"])
+# score of a shared city, relative to a shared topic
+CITY_WEIGHT = 2
+
+
+def _shard(wsck):
+    return int(hashlib.md5(wsck).hexdigest(), 16) % NUM_SHARDS
+
+
+def _indexKey(topic, shard):
+    return ndb.Key(TopicIndex, u'%s:%d' % (topic, shard))
+
+
+def _cacheKey(topic, shard):
+    # topics may be longer than memcache keys allow
+    return '%s%s_%d' % (MEMCACHE_TOPIC_INDEX_PREFIX,
+                        hashlib.md5(topic.encode('utf-8')).hexdigest(), shard)
+
+
+def _topics(topics):
+    return set(topics or []) - IGNORED_TOPICS
+
+
+def _entry(conf):
+    return {'city': conf.city,
+            'startDate': str(conf.startDate) if conf.startDate else None}
+
+
+def _isUpcoming(entry, today):
+    # conferences without a start date may still be upcoming
+    return not entry['startDate'] or entry['startDate'] >= today
+
+
+def record(conf, oldTopics=()):
+    """Index a created or updated conference in the background; when called
+    in a transaction it is only indexed if the transaction commits."""
+    taskqueue.add(url='/tasks/index_topics',
+                  params={'websafeConferenceKey': conf.key.urlsafe(),
+                          'oldTopics': list(oldTopics)},
+                  transactional=ndb.in_transaction())
+
+
+def indexConference(conf, oldTopics=()):
+    """Put a conference in the index of each of its topics and remove it
+    from the topics it no longer has. Indexing twice has no further
+    effect, so it is safe to retry."""
+    wsck = conf.key.urlsafe()
+    shard = _shard(wsck)
+    topics = _topics(conf.topics)
+    oldTopics = _topics(oldTopics)
+    for topic in topics:
+        _updateIndex(_indexKey(topic, shard), wsck, _entry(conf))
+    for topic in oldTopics - topics:
+        _updateIndex(_indexKey(topic, shard), wsck, None)
+    memcache.delete_multi([_cacheKey(topic, shard)
+                           for topic in topics | oldTopics])
+
+
+@ndb.transactional()
+def _updateIndex(key, wsck, entry):
+    """Set (or with entry None, remove) the entry of a conference in an
+    index shard, dropping the conferences already started and those past
+    the MAX_SHARD_ENTRIES starting first."""
+    index = key.get() or TopicIndex(key=key)
+    today = str(date.today())
+    entries = dict((k, e) for k, e in (index.entries or {}).items()
+                   if _isUpcoming(e, today))
+    if entry:
+        entries[wsck] = entry
+    else:
+        entries.pop(wsck, None)
+    if len(entries) > MAX_SHARD_ENTRIES:
+        kept = sorted(entries, key=lambda k: (
+            entries[k]['startDate'] or '9999', k))[:MAX_SHARD_ENTRIES]
+        entries = dict((k, entries[k]) for k in kept)
+    if entries:
+        index.entries = entries
+        index.put()
+    elif index.entries:
+        index.key.delete()
+
+
+def getIndexes(topics):
+    """Return {topic: {websafeConferenceKey: entry}} of some topics, merged
+    from their shards read through memcache."""
+    shards = [(topic, shard) for topic in _topics(topics)
+              for shard in range(NUM_SHARDS)]
+    cached = memcache.get_multi([_cacheKey(*ts) for ts in shards])
+    missing = [ts for ts in shards if _cacheKey(*ts) not in cached]
+    if missing:
+        loaded = ndb.get_multi([_indexKey(*ts) for ts in missing])
+        found = dict((_cacheKey(*ts), (index.entries or {}) if index else {})
+                     for ts, index in zip(missing, loaded))
+        memcache.set_multi(found)
+        cached.update(found)
+    indexes = {}
+    for topic, shard in shards:
+        indexes.setdefault(topic, {}).update(cached[_cacheKey(topic, shard)])
+    return indexes
+
+
+def recommend(attended, limit):
+    """Return the websafe keys of the upcoming conferences sharing most
+    topics & cities with the attended conferences, best first.
+
+    A shared topic scores as many points as attended conferences have it,
+    a shared city CITY_WEIGHT points per attended conference there. Ties
+    go to the conference starting first.
+    """
+    topicWeights = {}
+    cityWeights = {}
+    for conf in attended:
+        for topic in conf.topics or []:
+            topicWeights[topic] = topicWeights.get(topic, 0) + 1
+        if conf.city:
+            cityWeights[conf.city] = cityWeights.get(conf.city, 0) + 1
+    exclude = set(conf.key.urlsafe() for conf in attended)
+
+    today = str(date.today())
+    scores = {}
+    entries = {}
+    for topic, index in getIndexes(topicWeights).items():
+        for wsck, entry in index.items():
+            if wsck in exclude or not _isUpcoming(entry, today):
+                continue
+            scores[wsck] = scores.get(wsck, 0) + topicWeights[topic]
+            entries[wsck] = entry
+    for wsck, entry in entries.items():
+        scores[wsck] += CITY_WEIGHT * cityWeights.get(entry['city'], 0)
+
+    ranked = sorted(scores, key=lambda wsck: (
+        -scores[wsck], entries[wsck]['startDate'] or '9999', wsck))
+    return ranked[:limit]
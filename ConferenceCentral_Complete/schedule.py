@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+"""schedule.py
+
+Udacity conference server-side Python App Engine session & conference
+schedule helpers
+
+"""
+
+import bisect
+from datetime import datetime
+from datetime import timedelta
+
+# session start times are bucketed in slots of this many minutes
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# start slots are grouped in aligned blocks of 1, 2, 4 ... 64 slots
+SLOT_LEVELS = 7
+# upper bounds (in minutes) of the session duration classes
+DURATION_LIMITS = (15, 30, 45, 60, 90, 120, 180, 240, 480)
+# conference spans are bucketed by year-month ('2016-03') & ISO week
+# ('2016-W09'); a date range is queried with at most this many buckets,
+# and a conference may span at most this many weeks
+MAX_SPAN_BUCKETS = 30
+
+
+def startSlot(time):
+    """Return the slot of the day in which a start time falls."""
+    return (time.hour * 60 + time.minute) // SLOT_MINUTES
+
+
+def startBlocks(time):
+    """Return the start blocks containing a start time, one per level."""
+    slot = startSlot(time)
+    return ['%d:%d' % (level, slot >> level) for level in range(SLOT_LEVELS)]
+
+
+def startBlockCover(earliest=None, latest=None):
+    """Return the fewest start blocks covering the slots of the start
+    times between earliest and latest (both included)."""
+    lo = 0 if earliest is None else startSlot(earliest)
+    hi = SLOTS_PER_DAY - 1 if latest is None else startSlot(latest)
+    blocks = []
+    while lo <= hi:
+        # grow the block while it stays aligned & inside the range
+        level = 0
+        while (level < SLOT_LEVELS - 1 and lo % (2 << level) == 0 and
+               lo + (2 << level) - 1 <= hi):
+            level += 1
+        blocks.append('%d:%d' % (level, lo >> level))
+        lo += 1 << level
+    return blocks
+
+
+def durationLimits(duration):
+    """Return the indexes of the duration classes a duration fits in."""
+    return [i for i, limit in enumerate(DURATION_LIMITS)
+            if (duration or 0) <= limit]
+
+
+def durationLimitFor(maxDuration):
+    """Return the index of the smallest duration class holding every
+    duration up to maxDuration, or None if no class is large enough."""
+    i = bisect.bisect_left(DURATION_LIMITS, maxDuration)
+    if i == len(DURATION_LIMITS):
+        return None
+    return i
+
+
+def conferenceSpan(conf):
+    """Return the (first, last) days of a conference, or None if it has no
+    start date. Conferences without an end date last one day."""
+    if conf.startDate is None:
+        return None
+    return (conf.startDate, conf.endDate or conf.startDate)
+
+
+def monthBuckets(first, last):
+    """Return the year-month buckets covering the days first..last."""
+    buckets = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        buckets.append('%04d-%02d' % (year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+
+def weekBuckets(first, last):
+    """Return the ISO week buckets covering the days first..last."""
+    buckets = []
+    # walk the mondays of the weeks, starting with the week of 'first'
+    day = first - timedelta(days=first.weekday())
+    while day <= last:
+        year, week, _ = day.isocalendar()
+        buckets.append('%04d-W%02d' % (year, week))
+        day += timedelta(days=7)
+    return buckets
+
+
+def spanFits(first, last):
+    """Return True if the days first..last span at most MAX_SPAN_BUCKETS
+    ISO weeks."""
+    monday = first - timedelta(days=first.weekday())
+    return (last - monday).days // 7 < MAX_SPAN_BUCKETS
+
+
+def spanBuckets(conf, buckets):
+    """Return the buckets covering the span of a conference, given the
+    bucketing function (monthBuckets or weekBuckets).
+
+    Spans are cut to their first MAX_SPAN_BUCKETS weeks, which keeps the
+    bucket lists (and the index entries they make) bounded for conferences
+    stored before spans were checked.
+    """
+    span = conferenceSpan(conf)
+    if span is None or span[1] < span[0]:
+        return []
+    first, last = span
+    if not spanFits(first, last):
+        last = (first - timedelta(days=first.weekday()) +
+                timedelta(weeks=MAX_SPAN_BUCKETS, days=-1))
+    return buckets(first, last)
+
+
+def spanBucketCover(first, last):
+    """Return the (property, buckets) to query for the conferences running
+    between the days first & last: ISO weeks for short ranges, year-months
+    for longer ones. None is returned if the range needs more than
+    MAX_SPAN_BUCKETS buckets either way."""
+    if last < first:
+        return ('monthBuckets', [])
+    weeks = weekBuckets(first, last)
+    if len(weeks) <= MAX_SPAN_BUCKETS:
+        return ('weekBuckets', weeks)
+    months = monthBuckets(first, last)
+    if len(months) <= MAX_SPAN_BUCKETS:
+        return ('monthBuckets', months)
+    return None
+
+
+def spanOverlaps(conf, first, last):
+    """Return True if a conference runs on any day between first & last."""
+    span = conferenceSpan(conf)
+    return span is not None and span[0] <= last and span[1] >= first
+
+
+def sessionInterval(session):
+    """Return the (start, end, websafeKey) interval of a session.
+
+    Sessions without a date can not be placed in the schedule, so None
+    is returned for them.
+    """
+    if not session.date:
+        return None
+    start = datetime.combine(session.date, session.startTime)
+    end = start + timedelta(minutes=session.duration or 0)
+    return (start, end, session.key.urlsafe())
+
+
+class SessionIntervalIndex(object):
+    """SessionIntervalIndex -- sorted index of session time intervals
+
+    Intervals are kept ordered by start time, together with the running
+    maximum of their end times. An overlap lookup is a binary search on
+    the start times followed by a backwards walk that stops as soon as no
+    earlier interval can reach the requested start.
+    """
+
+    def __init__(self, intervals=()):
+        # (start, end, websafeKey) tuples, ordered by start time
+        self._intervals = sorted(intervals)
+        self._starts = [interval[0] for interval in self._intervals]
+        # maximum end time among intervals[0..i]
+        self._maxEnds = []
+        maxEnd = None
+        for start, end, key in self._intervals:
+            if maxEnd is None or end > maxEnd:
+                maxEnd = end
+            self._maxEnds.append(maxEnd)
+        self._byKey = dict((interval[2], interval)
+                           for interval in self._intervals)
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __contains__(self, key):
+        return key in self._byKey
+
+    def interval(self, key):
+        """Return the interval stored for a session key, or None."""
+        return self._byKey.get(key)
+
+    def overlapping(self, start, end, exclude=None):
+        """Return keys of the intervals overlapping [start, end)."""
+        keys = []
+        # only intervals starting before 'end' may overlap
+        i = bisect.bisect_left(self._starts, end) - 1
+        while i >= 0 and self._maxEnds[i] > start:
+            interval = self._intervals[i]
+            if interval[1] > start and interval[2] != exclude:
+                keys.append(interval[2])
+            i -= 1
+        return keys
+
+    def conflicts(self, key):
+        """Return keys of the intervals overlapping the one of 'key'."""
+        interval = self._byKey.get(key)
+        if not interval:
+            return []
+        return self.overlapping(interval[0], interval[1], exclude=key)
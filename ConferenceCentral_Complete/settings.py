@@ -16,3 +16,17 @@ WEB_CLIENT_ID = '311275972649-gbaof9hp8eeks192ft5e4934fa7puod4.apps.googleuserco
 ANDROID_CLIENT_ID = 'replace with Android client ID'
 IOS_CLIENT_ID = 'replace with iOS client ID'
 ANDROID_AUDIENCE = WEB_CLIENT_ID
+
+# Emails of the users allowed to call the admin endpoints.
+ADMIN_EMAILS = []
+
+# Fraction of all requests profiled with cProfile (see profiling.py);
+# admins profile a request with the X-Profile header.
+PROFILING_SAMPLE_RATE = 0.0
+
+# Per user rate limits of the hot endpoints: (requests per second, burst).
+RATE_LIMITS = {
+    'queryConferences': (2, 20),
+    'registerForConference': (0.5, 5),
+    'unregisterFromConference': (0.5, 5),
+}
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+
+"""speakers.py
+
+Udacity conference server-side Python App Engine speaker directory
+
+"""
+
+from google.appengine.ext import ndb
+
+
+@ndb.transactional()
+def addSessionToSpeaker(speaker_key, session_key):
+    """Update the speaker directory aggregates with a new session."""
+    speaker = speaker_key.get()
+    wssk = session_key.urlsafe()
+    if wssk in speaker.sessionKeys:
+        # already counted
+        return speaker
+    speaker.sessionKeys.append(wssk)
+    speaker.sessionCount = len(speaker.sessionKeys)
+    wsck = session_key.parent().urlsafe()
+    if wsck not in speaker.conferenceKeys:
+        speaker.conferenceKeys.append(wsck)
+    speaker.put()
+    return speaker
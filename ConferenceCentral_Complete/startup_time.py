@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""startup_time.py -- Udacity conference instance startup measurement
+
+Reports the import time of the app modules, each imported in a fresh
+interpreter with the App Engine SDK on the path, and the latency of the
+first & following requests to a freshly started server.
+
+usage: python startup_time.py imports <App Engine SDK dir>
+       python startup_time.py requests [server URL] [--warmup]
+
+Restart dev_appserver.py before measuring requests; with --warmup the
+/_ah/warmup request a new instance receives is sent first.
+
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+try:
+    from urllib2 import Request, urlopen
+except ImportError:
+    from urllib.request import Request, urlopen
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODULES = ('main', 'conference')
+# requests of the first page load of the web client
+URLS = ('/_ah/api/conference/v1/conference/announcement/get',
+        '/_ah/api/conference/v1/sessions/speaker/get',
+        '/_ah/api/conference/v1/queryConferences')
+SERVER = 'http://localhost:8080'
+# dev_appserver lets admin-only handlers through with this cookie
+ADMIN_COOKIE = 'dev_appserver_login="test@example.com:True:1"'
+REPEAT = 3
+
+IMPORT_SCRIPT = '''
+import sys, time
+sys.path.insert(0, %(sdk)r)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, %(root)r)
+start = time.time()
+import %(module)s
+sys.stdout.write('%%f' %% (time.time() - start))
+'''
+
+
+def importTime(sdk, module):
+    """Return the seconds spent importing a module in a new interpreter."""
+    script = IMPORT_SCRIPT % {'sdk': sdk, 'root': ROOT, 'module': module}
+    return float(subprocess.check_output([sys.executable, '-c', script]))
+
+
+def requestTime(url, method='GET', headers=None):
+    """Return the seconds spent on one request."""
+    data = b'{}' if method == 'POST' else None
+    request = Request(url, data=data, headers=headers or {})
+    if data:
+        request.add_header('Content-Type', 'application/json')
+    start = time.time()
+    urlopen(request).read()
+    return time.time() - start
+
+
+def reportImports(sdk):
+    for module in MODULES:
+        times = [importTime(sdk, module) for _ in range(REPEAT)]
+        print('import %-12s %7.1fms (best of %d)' % (
+            module, min(times) * 1000, REPEAT))
+
+
+def reportRequests(server=SERVER, warmup=False):
+    if warmup:
+        print('%-60s %7.1fms' % ('/_ah/warmup', 1000 * requestTime(
+            server + '/_ah/warmup', headers={'Cookie': ADMIN_COOKIE})))
+    for path in URLS:
+        method = 'POST' if path.endswith('queryConferences') else 'GET'
+        first = requestTime(server + path, method)
+        then = min(requestTime(server + path, method)
+                   for _ in range(REPEAT))
+        print('%-60s %7.1fms first, %7.1fms then' % (
+            path, first * 1000, then * 1000))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'imports':
+        reportImports(sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'requests':
+        args = [arg for arg in sys.argv[2:] if arg != '--warmup']
+        reportRequests(*args, warmup='--warmup' in sys.argv)
+    else:
+        sys.exit(__doc__)
@@ -130,3 +130,154 @@ app.factory('oauth2Provider', function ($modal) {
 
     return oauth2Provider;
 });
+
+
+/**
+ * @ngdoc service
+ * @name etagCache
+ *
+ * @description
+ * Service that keeps the last ETag and result of conditional API calls, so that the server can answer
+ * "not modified" instead of rebuilding responses the client already has.
+ *
+ */
+app.factory('etagCache', function () {
+    var entries = {};
+
+    var etagCache = {};
+
+    /**
+     * Returns a copy of the request params including the last ETag stored for the key.
+     *
+     * @param {string} key
+     * @param {Object} params
+     * @returns {Object}
+     */
+    etagCache.params = function (key, params) {
+        var conditionalParams = angular.extend({}, params);
+        if (entries[key]) {
+            conditionalParams.ifNoneMatch = entries[key].etag;
+        }
+        return conditionalParams;
+    };
+
+    /**
+     * Resolves the response of a conditional call: "not modified" responses are replaced by the stored result,
+     * and new results are stored with their ETag.
+     *
+     * @param {string} key
+     * @param {Object} resp
+     * @returns {Object} the response to use.
+     */
+    etagCache.resolve = function (key, resp) {
+        if (resp.error || !resp.result) {
+            return resp;
+        }
+        if (resp.result.notModified && entries[key]) {
+            return {result: entries[key].result};
+        }
+        if (resp.result.etag) {
+            entries[key] = {etag: resp.result.etag, result: resp.result};
+        }
+        return resp;
+    };
+
+    return etagCache;
+});
+
+
+/**
+ * @ngdoc service
+ * @name apiCache
+ *
+ * @description
+ * Service that caches the responses of read API calls for a short time and coalesces identical calls in flight,
+ * so repeated navigations and filter edits don't hit the API again.
+ *
+ */
+app.factory('apiCache', function () {
+    var entries = {};
+    var pending = {};
+
+    var apiCache = {
+        /**
+         * Milliseconds a response is served from the cache.
+         * @type {number}
+         */
+        TTL: 60 * 1000
+    };
+
+    /**
+     * Returns the cache key of a call, the same for equivalent params in any order.
+     *
+     * @param {string} name
+     * @param {Object|Array} params
+     * @returns {string}
+     */
+    apiCache.key = function (name, params) {
+        var normalize = function (value) {
+            if (angular.isArray(value)) {
+                return value.map(normalize).sort();
+            }
+            if (angular.isObject(value)) {
+                return Object.keys(value).sort().map(function (key) {
+                    return [key, normalize(value[key])];
+                });
+            }
+            return value;
+        };
+        return name + ':' + JSON.stringify(normalize(params || {}));
+    };
+
+    /**
+     * Executes the request built by requestFn unless a fresh response is cached or the same call is in flight,
+     * and calls back with the response. The callback is always asynchronous.
+     *
+     * @param {string} key the cache key of the call.
+     * @param {Function} requestFn returns the gapi request to execute.
+     * @param {Function} callback
+     */
+    apiCache.execute = function (key, requestFn, callback) {
+        var entry = entries[key];
+        if (entry && entry.expires > Date.now()) {
+            setTimeout(function () {
+                callback(entry.resp);
+            }, 0);
+            return;
+        }
+        if (pending[key]) {
+            pending[key].push(callback);
+            return;
+        }
+        pending[key] = [callback];
+        requestFn().execute(function (resp) {
+            if (!resp.error) {
+                entries[key] = {resp: resp, expires: Date.now() + apiCache.TTL};
+            }
+            var callbacks = pending[key];
+            delete pending[key];
+            angular.forEach(callbacks, function (cb) {
+                cb(resp);
+            });
+        });
+    };
+
+    /**
+     * Drops the cached responses of the given API methods, or all of them if none is given.
+     *
+     * @param {...string} names
+     */
+    apiCache.invalidate = function () {
+        var names = Array.prototype.slice.call(arguments);
+        angular.forEach(Object.keys(entries), function (key) {
+            var matches = names.length == 0 || names.some(function (name) {
+                return key.indexOf(name + ':') == 0;
+            });
+            if (matches) {
+                delete entries[key];
+            }
+        });
+    };
+
+    return apiCache;
+});
@@ -25,7 +25,7 @@ conferenceApp.controllers = angular.module('conferenceControllers', ['ui.bootstr
  * A controller used for the My Profile page.
  */
 conferenceApp.controllers.controller('MyProfileCtrl',
-    function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+    function ($scope, $log, oauth2Provider, HTTP_ERRORS, etagCache, apiCache) {
         $scope.submitted = false;
         $scope.loading = false;
 
@@ -63,21 +63,22 @@ conferenceApp.controllers.controller('MyProfileCtrl',
             var retrieveProfileCallback = function () {
                 $scope.profile = {};
                 $scope.loading = true;
-                gapi.client.conference.getProfile().
-                    execute(function (resp) {
-                        $scope.$apply(function () {
-                            $scope.loading = false;
-                            if (resp.error) {
-                                // Failed to get a user profile.
-                            } else {
-                                // Succeeded to get the user profile.
-                                $scope.profile.displayName = resp.result.displayName;
-                                $scope.profile.teeShirtSize = resp.result.teeShirtSize;
-                                $scope.initialProfile = resp.result;
-                            }
-                        });
-                    }
-                );
+                apiCache.execute(apiCache.key('getProfile'), function () {
+                    return gapi.client.conference.getProfile(etagCache.params('profile', {}));
+                }, function (resp) {
+                    resp = etagCache.resolve('profile', resp);
+                    $scope.$apply(function () {
+                        $scope.loading = false;
+                        if (resp.error) {
+                            // Failed to get a user profile.
+                        } else {
+                            // Succeeded to get the user profile.
+                            $scope.profile.displayName = resp.result.displayName;
+                            $scope.profile.teeShirtSize = resp.result.teeShirtSize;
+                            $scope.initialProfile = resp.result;
+                        }
+                    });
+                });
             };
             if (!oauth2Provider.signedIn) {
                 var modalInstance = oauth2Provider.showLoginModal();
@@ -111,6 +112,9 @@ conferenceApp.controllers.controller('MyProfileCtrl',
                             }
                         } else {
                             // The request has succeeded.
+                            // The display name is shown in the profile and the conferences organized.
+                            apiCache.invalidate('getProfile', 'getConference', 'getConferenceDetail',
+                                'queryConferences', 'getConferencesCreated', 'getConferencesToAttend');
                             $scope.messages = 'The profile has been updated';
                             $scope.alertStatus = 'success';
                             $scope.submitted = false;
@@ -135,7 +139,7 @@ conferenceApp.controllers.controller('MyProfileCtrl',
  * A controller used for the Create conferences page.
  */
 conferenceApp.controllers.controller('CreateConferenceCtrl',
-    function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+    function ($scope, $log, oauth2Provider, HTTP_ERRORS, apiCache) {
 
         /**
          * The conference object being edited in the page.
@@ -231,6 +235,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
                             }
                         } else {
                             // The request has succeeded.
+                            apiCache.invalidate('queryConferences', 'getConferencesCreated', 'getConferenceFacets');
                             $scope.messages = 'The conference has been created : ' + resp.result.name;
                             $scope.alertStatus = 'success';
                             $scope.submitted = false;
@@ -249,7 +254,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
  * @description
  * A controller used for the Show conferences page.
  */
-conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, $timeout, oauth2Provider, HTTP_ERRORS, apiCache) {
 
     /**
      * Holds the status if the query is being executed.
@@ -266,11 +271,18 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     $scope.filters = [
     ];
 
+    /**
+     * Holds whether queryConferencesAll searches the archived conferences instead of the live ones.
+     * @type {{archived: boolean}}
+     */
+    $scope.search = {archived: false};
+
     $scope.filtereableFields = [
         {enumValue: 'CITY', displayName: 'City'},
         {enumValue: 'TOPIC', displayName: 'Topic'},
         {enumValue: 'MONTH', displayName: 'Start month'},
-        {enumValue: 'MAX_ATTENDEES', displayName: 'Max Attendees'}
+        {enumValue: 'MAX_ATTENDEES', displayName: 'Max Attendees'},
+        {enumValue: 'DATE', displayName: 'Date (YYYY-MM-DD)'}
     ]
 
     /**
@@ -293,6 +305,13 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.conferences = [];
 
+    /**
+     * Holds the number of conferences per value of the city, topic and month fields, narrowed by the
+     * equality filters of the last query.
+     * @type {{CITY: Array, TOPIC: Array, MONTH: Array}}
+     */
+    $scope.facets = {CITY: [], TOPIC: [], MONTH: []};
+
     /**
      * Holds the state if offcanvas is enabled.
      *
@@ -390,6 +409,26 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         })
     };
 
+    /**
+     * Adds an equality filter on the value of a facet.
+     *
+     * @param facet the facet clicked, with its field and value
+     */
+    $scope.addFacetFilter = function (facet) {
+        var field, operator;
+        angular.forEach($scope.filtereableFields, function (f) {
+            if (f.enumValue == facet.field) {
+                field = f;
+            }
+        });
+        angular.forEach($scope.operators, function (o) {
+            if (o.enumValue == 'EQ') {
+                operator = o;
+            }
+        });
+        $scope.filters.push({field: field, operator: operator, value: facet.value});
+    };
+
     /**
      * Clears all filters.
      */
@@ -408,6 +447,30 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         }
     };
 
+    /**
+     * Milliseconds to wait after the last filter edit before querying the conferences.
+     * @type {number}
+     */
+    var FILTER_DEBOUNCE = 500;
+
+    var filterQueryPromise = null;
+
+    /**
+     * Queries the conferences once the filters stop changing, so rapid edits end up in a single call.
+     */
+    $scope.$watch('filters', function (newFilters, oldFilters) {
+        if (newFilters === oldFilters || $scope.selectedTab != 'ALL') {
+            return;
+        }
+        if (filterQueryPromise) {
+            $timeout.cancel(filterQueryPromise);
+        }
+        filterQueryPromise = $timeout(function () {
+            filterQueryPromise = null;
+            $scope.queryConferencesAll();
+        }, FILTER_DEBOUNCE);
+    }, true);
+
     /**
      * Query the conferences depending on the tab currently selected.
      *
@@ -430,6 +493,9 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         var sendFilters = {
             filters: []
         }
+        if ($scope.search.archived) {
+            sendFilters.archived = true;
+        }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
             if (filter.field && filter.operator && filter.value) {
@@ -441,68 +507,94 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
             }
         }
         $scope.loading = true;
-        gapi.client.conference.queryConferences(sendFilters).
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query conferences : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+        $scope.getConferenceFacets(sendFilters);
+        apiCache.execute(apiCache.key('queryConferences', sendFilters), function () {
+            return gapi.client.conference.queryConferences(sendFilters);
+        }, function (resp) {
+            $scope.$apply(function () {
+                $scope.loading = false;
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query conferences : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
+                } else {
+                    // The request has succeeded.
+                    $scope.submitted = false;
+                    $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
 
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
-                    }
-                    $scope.submitted = true;
-                });
+                    $scope.conferences = [];
+                    angular.forEach(resp.items, function (conference) {
+                        $scope.conferences.push(conference);
+                    });
+                }
+                $scope.submitted = true;
             });
+        });
     }
 
+    /**
+     * Invokes the conference.getConferenceFacets API with the filters of the query.
+     *
+     * @param sendFilters the filters sent to conference.queryConferences
+     */
+    $scope.getConferenceFacets = function (sendFilters) {
+        apiCache.execute(apiCache.key('getConferenceFacets', sendFilters), function () {
+            return gapi.client.conference.getConferenceFacets(sendFilters);
+        }, function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    $log.error('Failed to get the conference facets : ' + (resp.error.message || ''));
+                    return;
+                }
+                var facets = {CITY: [], TOPIC: [], MONTH: []};
+                angular.forEach(resp.items, function (facet) {
+                    facets[facet.field].push(facet);
+                });
+                $scope.facets = facets;
+            });
+        });
+    };
+
     /**
      * Invokes the conference.getConferencesCreated method.
      */
     $scope.getConferencesCreated = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences created : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
-
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : Conferences you have created';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+        apiCache.execute(apiCache.key('getConferencesCreated'), function () {
+            return gapi.client.conference.getConferencesCreated();
+        }, function (resp) {
+            $scope.$apply(function () {
+                $scope.loading = false;
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query the conferences created : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages);
 
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
+                    if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                        oauth2Provider.showLoginModal();
+                        return;
                     }
-                    $scope.submitted = true;
-                });
+                } else {
+                    // The request has succeeded.
+                    $scope.submitted = false;
+                    $scope.messages = 'Query succeeded : Conferences you have created';
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
+
+                    $scope.conferences = [];
+                    angular.forEach(resp.items, function (conference) {
+                        $scope.conferences.push(conference);
+                    });
+                }
+                $scope.submitted = true;
             });
+        });
     };
 
     /**
@@ -511,31 +603,32 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.getConferencesAttend = function () {
         $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences to attend : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
+        apiCache.execute(apiCache.key('getConferencesToAttend'), function () {
+            return gapi.client.conference.getConferencesToAttend();
+        }, function (resp) {
+            $scope.$apply(function () {
+                if (resp.error) {
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to query the conferences to attend : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages);
 
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.conferences = resp.result.items;
-                        $scope.loading = false;
-                        $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
+                    if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                        oauth2Provider.showLoginModal();
+                        return;
                     }
-                    $scope.submitted = true;
-                });
+                } else {
+                    // The request has succeeded.
+                    $scope.conferences = resp.result.items;
+                    $scope.loading = false;
+                    $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
+                    $scope.alertStatus = 'success';
+                    $log.info($scope.messages);
+                }
+                $scope.submitted = true;
             });
+        });
     };
 });
 
@@ -547,21 +640,52 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
  * @description
  * A controller used for the conference detail page.
  */
-conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $log, $routeParams, HTTP_ERRORS, oauth2Provider, apiCache, etagCache) {
     $scope.conference = {};
 
     $scope.isUserAttending = false;
 
+    /**
+     * Holds the first sessions of the conference agenda.
+     * @type {Array}
+     */
+    $scope.sessions = [];
+
+    /**
+     * Holds the number of sessions in the conference agenda.
+     * @type {number}
+     */
+    $scope.sessionCount = 0;
+
+    /**
+     * Holds the keys of the sessions of the conference in the user's wishlist.
+     * @type {Array}
+     */
+    $scope.wishlistSessionKeys = [];
+
+    /**
+     * Holds the position of the user in the waitlist of the conference, 0 if not waiting.
+     * @type {number}
+     */
+    $scope.waitlistPosition = 0;
+
+    $scope.featuredSpeaker = '';
+
     /**
      * Initializes the conference detail page.
-     * Invokes the conference.getConference method and sets the returned conference in the $scope.
+     * Invokes the conference.getConferenceDetail method, which returns the conference together with the
+     * registration state of the user, the featured speaker and the first sessions, and sets them in the $scope.
      *
      */
     $scope.init = function () {
         $scope.loading = true;
-        gapi.client.conference.getConference({
-            websafeConferenceKey: $routeParams.websafeConferenceKey
-        }).execute(function (resp) {
+        var etagKey = 'conferenceDetail:' + $routeParams.websafeConferenceKey;
+        apiCache.execute(apiCache.key('getConferenceDetail', $routeParams.websafeConferenceKey), function () {
+            return gapi.client.conference.getConferenceDetail(etagCache.params(etagKey, {
+                websafeConferenceKey: $routeParams.websafeConferenceKey
+            }));
+        }, function (resp) {
+            resp = etagCache.resolve(etagKey, resp);
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
@@ -573,29 +697,51 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                     $log.error($scope.messages);
                 } else {
                     // The request has succeeded.
+                    var detail = resp.result;
                     $scope.alertStatus = 'success';
-                    $scope.conference = resp.result;
+                    $scope.conference = detail.conference;
+                    $scope.sessions = detail.sessions || [];
+                    $scope.sessionCount = detail.sessionCount || 0;
+                    $scope.featuredSpeaker = detail.featuredSpeaker;
+                    $scope.wishlistSessionKeys = detail.wishlistSessionKeys || [];
+                    $scope.waitlistPosition = detail.waitlistPosition || 0;
+                    if (detail.isAttending) {
+                        // The user is attending the conference.
+                        $scope.alertStatus = 'info';
+                        $scope.messages = 'You are attending this conference';
+                        $scope.isUserAttending = true;
+                    }
                 }
             });
         });
+    };
 
+    /**
+     * Invokes the conference.joinWaitlist method.
+     */
+    $scope.joinWaitlist = function () {
         $scope.loading = true;
-        // If the user is attending the conference, updates the status message and available function.
-        gapi.client.conference.getProfile().execute(function (resp) {
+        gapi.client.conference.joinWaitlist({
+            websafeConferenceKey: $routeParams.websafeConferenceKey
+        }).execute(function (resp) {
             $scope.$apply(function () {
                 $scope.loading = false;
                 if (resp.error) {
-                    // Failed to get a user profile.
-                } else {
-                    var profile = resp.result;
-                    for (var i = 0; i < profile.conferenceKeysToAttend.length; i++) {
-                        if ($routeParams.websafeConferenceKey == profile.conferenceKeysToAttend[i]) {
-                            // The user is attending the conference.
-                            $scope.alertStatus = 'info';
-                            $scope.messages = 'You are attending this conference';
-                            $scope.isUserAttending = true;
-                        }
+                    // The request has failed.
+                    var errorMessage = resp.error.message || '';
+                    $scope.messages = 'Failed to join the waitlist : ' + errorMessage;
+                    $scope.alertStatus = 'warning';
+                    $log.error($scope.messages);
+
+                    if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+                        oauth2Provider.showLoginModal();
+                        return;
                     }
+                } else {
+                    apiCache.invalidate('getConferenceDetail');
+                    $scope.waitlistPosition = resp.result.position;
+                    $scope.messages = 'You are number ' + $scope.waitlistPosition + ' on the waitlist';
+                    $scope.alertStatus = 'info';
                 }
             });
         });
@@ -624,6 +770,9 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
+                    // Seats and the registrations changed.
+                    apiCache.invalidate('getConference', 'getConferenceDetail', 'getProfile', 'queryConferences',
+                        'getConferencesToAttend');
                     if (resp.result) {
                         // Register succeeded.
                         $scope.messages = 'Registered for the conference';
@@ -660,6 +809,9 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
                         return;
                     }
                 } else {
+                    // Seats and the registrations changed.
+                    apiCache.invalidate('getConference', 'getConferenceDetail', 'getProfile', 'queryConferences',
+                        'getConferencesToAttend');
                     if (resp.result) {
                         // Unregister succeeded.
                         $scope.messages = 'Unregistered from the conference';
@@ -691,7 +843,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
  * such as user authentications.
  *
  */
-conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider) {
+conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider, apiCache) {
 
     /**
      * Returns if the viewLocation is the currently viewed page.
@@ -755,6 +907,8 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
      */
     $scope.signOut = function () {
         oauth2Provider.signOut();
+        // Cached responses belong to the user signing out.
+        apiCache.invalidate();
         $scope.alertStatus = 'success';
         $scope.rootMessages = 'Logged out';
     };
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""sync.py
+
+Udacity conference server-side Python App Engine incremental sync
+
+Conferences & sessions carry the time of their last write and deleted
+ones leave a Tombstone. A sync round returns what changed between the
+'since' time of the client token and the start of the round, kind after
+kind (conferences, sessions, then deletions), in pages chained by
+opaque tokens holding the bounds, the kind and a query cursor. The last
+page returns the token of the next round, starting where this one ended.
+
+The round ends SETTLE_SECONDS in the past, so writes still being indexed
+are left to the next round. Tombstones are kept TOMBSTONE_DAYS; older
+tokens start a full sync instead.
+
+"""
+
+import base64
+import calendar
+import collections
+from datetime import datetime
+from datetime import timedelta
+import json
+
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Session
+from models import Tombstone
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+SETTLE_SECONDS = 10
+TOMBSTONE_DAYS = 30
+PRUNE_BATCH_SIZE = 500
+
+EPOCH = datetime(1970, 1, 1)
+# kinds returned by a round, in order, with their modification time
+PHASES = ((Conference, Conference.modified),
+          (Session, Session.modified),
+          (Tombstone, Tombstone.deleted))
+
+Changes = collections.namedtuple(
+    'Changes', ['conferences', 'sessions', 'deletedKeys', 'nextToken',
+                'more', 'fullSync'])
+
+
+def _toMicros(dt):
+    return calendar.timegm(dt.utctimetuple()) * 10 ** 6 + dt.microsecond
+
+
+def _fromMicros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _encode(state):
+    return base64.urlsafe_b64encode(json.dumps(state, sort_keys=True))
+
+
+def _decode(token):
+    """Return the state of a token. Raise ValueError if it is invalid."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(str(token)))
+        int(state['since'])
+    except (TypeError, KeyError, ValueError, UnicodeEncodeError):
+        raise ValueError('Invalid sync token')
+    return state
+
+
+def changesSince(token, pageSize=PAGE_SIZE):
+    """Return the Changes page of a sync token; without a token, a full
+    sync is started. Raise ValueError if the token is invalid."""
+    state = _decode(token) if token else {'since': 0}
+    fullSync = False
+    if 'until' not in state:
+        # first page of a round
+        now = datetime.utcnow()
+        since = state['since']
+        if since and _fromMicros(since) < now - timedelta(
+                days=TOMBSTONE_DAYS):
+            # deletions since then may have been pruned
+            since = 0
+        fullSync = not since
+        state = {'since': since,
+                 'until': _toMicros(now - timedelta(seconds=SETTLE_SECONDS)),
+                 'phase': 0, 'cursor': None}
+    since, until = _fromMicros(state['since']), _fromMicros(state['until'])
+    # a full sync has no deletions to report
+    phases = len(PHASES) if state['since'] else len(PHASES) - 1
+
+    found = [[] for _ in PHASES]
+    while state['phase'] < phases and pageSize > 0:
+        model, prop = PHASES[state['phase']]
+        try:
+            cursor = Cursor(urlsafe=state['cursor'])
+        except Exception:
+            raise ValueError('Invalid sync token')
+        entities, nextCursor, more = model.query(
+            prop > since, prop <= until).order(prop).fetch_page(
+            pageSize, start_cursor=cursor)
+        found[state['phase']].extend(entities)
+        pageSize -= len(entities)
+        if more and nextCursor:
+            state['cursor'] = nextCursor.urlsafe()
+        else:
+            state['phase'] += 1
+            state['cursor'] = None
+
+    more = state['phase'] < phases
+    return Changes(
+        conferences=found[0], sessions=found[1],
+        deletedKeys=[tombstone.key.parent().urlsafe()
+                     for tombstone in found[2]],
+        nextToken=_encode(state if more else {'since': state['until']}),
+        more=more, fullSync=fullSync)
+
+
+def pruneTombstones():
+    """Delete the tombstones older than TOMBSTONE_DAYS."""
+    horizon = datetime.utcnow() - timedelta(days=TOMBSTONE_DAYS)
+    query = Tombstone.query(Tombstone.deleted < horizon)
+    cursor, more = None, True
+    while more:
+        keys, cursor, more = query.fetch_page(
+            PRUNE_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+        ndb.delete_multi(keys)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""waitlist.py
+
+Udacity conference server-side Python App Engine seat waitlists
+
+Users of a sold out conference join its waitlist instead of retrying to
+register. The entries of a waitlist are spread over a few shards, each
+an entity group of its own, so joining never contends with registrations
+on the conference entity group; entries are ordered by the time they
+joined. When seats free up, a task promotes the first users waiting
+across all shards, registering them in one cross-group transaction per
+shard, and chains itself while seats & users remain.
+
+"""
+
+import hashlib
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import Profile
+from models import WaitlistEntry
+from models import WaitlistShard
+import analytics
+import notifications
+
+from etags import CONFERENCE_VERSION_KEY
+from etags import PROFILE_VERSION_KEY
+from etags import bumpVersion
+from etags import bumpVersionOnCommit
+
+SHARDS = 4
+# users registered per shard transaction at most; with the conference &
+# the shard it stays within the 25 entity groups of a transaction
+PROMOTION_BATCH = 20
+
+
+def _shardKeys(wsck):
+    return [ndb.Key(WaitlistShard, '%s:%d' % (wsck, shard))
+            for shard in range(SHARDS)]
+
+
+def entryKey(wsck, user_id):
+    """Return the key of the waitlist entry of a user."""
+    shard = int(hashlib.md5(user_id.encode('utf-8')).hexdigest(), 16) % SHARDS
+    return ndb.Key(WaitlistEntry, user_id, parent=_shardKeys(wsck)[shard])
+
+
+@ndb.transactional()
+def join(wsck, user_id):
+    """Put a user at the end of the waitlist of a conference, unless the
+    user is waiting already. Return the entry.
+
+    The caller checked that the conference was sold out, but a seat may
+    have been freed, and its promotion task found the waitlist empty,
+    since; a promotion task is enqueued with the entry to catch that.
+    """
+    key = entryKey(wsck, user_id)
+    entry = key.get()
+    if not entry:
+        entry = WaitlistEntry(key=key)
+        entry.put()
+        bumpVersionOnCommit(PROFILE_VERSION_KEY % user_id)
+        record(wsck)
+    return entry
+
+
+def leave(wsck, user_id):
+    """Take a user off the waitlist of a conference."""
+    entryKey(wsck, user_id).delete()
+    # the users waiting behind move up
+    bumpVersion(CONFERENCE_VERSION_KEY % wsck)
+
+
+@ndb.tasklet
+def positionAsync(wsck, user_id):
+    """Return a future of the position of a user in the waitlist of a
+    conference, starting at 1, or 0 if the user is not waiting.
+
+    Each shard counts the entries that joined earlier with a keys-only
+    query, concurrently.
+    """
+    entry = yield entryKey(wsck, user_id).get_async()
+    if not entry:
+        raise ndb.Return(0)
+    counts = yield [WaitlistEntry.query(WaitlistEntry.joined < entry.joined,
+                                        ancestor=shardKey).count_async()
+                    for shardKey in _shardKeys(wsck)]
+    raise ndb.Return(sum(counts) + 1)
+
+
+def position(wsck, user_id):
+    """Return the position of a user in a waitlist (see positionAsync)."""
+    return positionAsync(wsck, user_id).get_result()
+
+
+def record(wsck):
+    """Promote waiting users in the background; when called in a
+    transaction they are only promoted if it commits."""
+    taskqueue.add(url='/tasks/promote_waitlist',
+                  params={'websafeConferenceKey': wsck},
+                  transactional=ndb.in_transaction())
+
+
+def promote(wsck):
+    """Register the first users waiting into the seats available."""
+    c_key = ndb.Key(urlsafe=wsck)
+    conf = c_key.get()
+    if not conf or conf.seatsAvailable <= 0:
+        return
+    batch = min(conf.seatsAvailable, PROMOTION_BATCH)
+
+    # merge the heads of the shards into the first users waiting overall
+    heads = [WaitlistEntry.query(ancestor=shardKey)
+             .order(WaitlistEntry.joined).fetch_async(batch)
+             for shardKey in _shardKeys(wsck)]
+    entries = sorted((entry for head in heads for entry in head.get_result()),
+                     key=lambda entry: entry.joined)[:batch]
+    byShard = {}
+    for entry in entries:
+        byShard.setdefault(entry.key.parent(), []).append(entry.key)
+
+    promoted = []
+    for e_keys in byShard.values():
+        promoted.extend(_promoteShard(c_key, e_keys))
+    for prof in promoted:
+        if prof.mainEmail:
+            notifications.enqueue(prof.mainEmail, 'waitlistPromoted',
+                                  name=conf.name)
+    if len(entries) == batch:
+        # more seats may be free & more users waiting; entries of users
+        # already registered were removed, so the next batch moves on
+        record(wsck)
+
+
+@ndb.transactional(xg=True)
+def _promoteShard(c_key, e_keys):
+    """Register the users of some entries of one shard, as long as seats
+    are available, and remove their entries. Return their profiles."""
+    wsck = c_key.urlsafe()
+    conf = c_key.get()
+    entries = [entry for entry in ndb.get_multi(e_keys) if entry]
+    profiles = ndb.get_multi([ndb.Key(Profile, entry.key.id())
+                              for entry in entries])
+    promoted = []
+    done = []
+    for entry, prof in zip(entries, profiles):
+        if prof and wsck not in prof.conferenceKeysToAttend:
+            if conf.seatsAvailable <= 0:
+                break
+            prof.conferenceKeysToAttend.append(wsck)
+            conf.seatsAvailable -= 1
+            promoted.append(prof)
+        done.append(entry.key)
+    ndb.delete_multi(done)
+    if done:
+        # the users waiting behind move up
+        bumpVersionOnCommit(CONFERENCE_VERSION_KEY % wsck)
+    if promoted:
+        ndb.put_multi(promoted + [conf])
+        analytics.record(analytics.seatDeltas(conf, -len(promoted)))
+        for prof in promoted:
+            bumpVersionOnCommit(PROFILE_VERSION_KEY % prof.key.id())
+    return promoted
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""warmup.py
+
+Udacity conference server-side Python App Engine instance warmup
+
+New instances receive /_ah/warmup before any user request. Warming up
+imports the API modules, so the first API request does not pay for them,
+and primes memcache with the announcement, the featured speaker and the
+conferences most likely to be read.
+
+"""
+
+import importlib
+import logging
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from models import Conference
+import announcements
+from etags import CONFERENCE_VERSION_KEY
+from etags import getVersions
+
+# modules imported on warmup, heaviest first
+WARM_MODULES = ('conference',)
+# nearly sold out conferences loaded into the ndb memcache cache
+HOT_CONFERENCES = 20
+
+
+def primeHotConferences():
+    """Load the conferences with the fewest seats left, so they & their
+    ETag versions are in memcache."""
+    c_keys = Conference.query(Conference.seatsAvailable > 0).order(
+        Conference.seatsAvailable).fetch(HOT_CONFERENCES, keys_only=True)
+    ndb.get_multi(c_keys)
+    getVersions([CONFERENCE_VERSION_KEY % c_key.urlsafe()
+                 for c_key in c_keys])
+    return len(c_keys)
+
+
+def warmup():
+    """Import the API modules & prime memcache. Return the time spent in
+    each step, in milliseconds."""
+    timings = []
+
+    def timed(step, fn, *args):
+        start = time.time()
+        fn(*args)
+        timings.append((step, int((time.time() - start) * 1000)))
+
+    for name in WARM_MODULES:
+        timed('import %s' % name, importlib.import_module, name)
+    if memcache.get(announcements.MEMCACHE_ANNOUNCEMENTS_KEY) is None:
+        timed('announcement', announcements.cacheAnnouncement)
+    timed('featured speaker', announcements.cacheFeaturedSpeaker)
+    timed('hot conferences', primeHotConferences)
+    logging.info('Warmup: %s', ', '.join('%s %dms' % timing
+                                         for timing in timings))
+    return timings